@@ -1,15 +1,110 @@
 # HouseHunt Scraper
-from bs4 import BeautifulSoup
-from requests import get
-from requests.structures import CaseInsensitiveDict
-from re import findall, match
+# requests and lxml are imported where they are first needed, so subcommands that only
+# read existing output (check, export) start without loading them
+from re import findall
 
-import urllib.parse, json, os, datetime, threading
+import urllib.parse, json, os, datetime, threading, time, random, email.utils, queue, hashlib, gzip, sqlite3, re, argparse, sys, contextlib, multiprocessing
+import csv, difflib, math, bisect
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from collections.abc import MutableMapping
+from typing import Optional, Union
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
 
-DATE_TODAY = datetime.datetime.today().strftime('%d/%m/%Y')
-REGEX_DATE = r'^(?:(?:31(\/|-|\.)(?:0?[13578]|1[02]))\1|(?:(?:29|30)(\/|-|\.)(?:0?[13-9]|1[0-2])\2))(?:(?:1[6-9]|[2-9]\d)?\d{2})$|^(?:29(\/|-|\.)0?2\3(?:(?:(?:1[6-9]|[2-9]\d)?(?:0[48]|[2468][048]|[13579][26])|(?:(?:16|[2468][048]|[3579][26])00))))$|^(?:0?[1-9]|1\d|2[0-8])(\/|-|\.)(?:(?:0?[1-9])|(?:1[0-2]))\4(?:(?:1[6-9]|[2-9]\d)?\d{2})$'
 GEOAPIFY_API_KEY = os.getenv('GEOAPIFY_API_KEY')
 
+HTTP_POOL_CONNECTIONS = int(os.getenv('HTTP_POOL_CONNECTIONS', 10))
+HTTP_POOL_MAXSIZE = int(os.getenv('HTTP_POOL_MAXSIZE', 16))
+HTTP_TIMEOUT = (float(os.getenv('HTTP_CONNECT_TIMEOUT', 5)), float(os.getenv('HTTP_READ_TIMEOUT', 30)))
+
+HTTP_RATE = float(os.getenv('HTTP_RATE', 8))
+HTTP_MIN_RATE = float(os.getenv('HTTP_MIN_RATE', 0.5))
+HTTP_BURST = int(os.getenv('HTTP_BURST', 8))
+HTTP_RETRIES = int(os.getenv('HTTP_RETRIES', 3))
+HTTP_BACKOFF = float(os.getenv('HTTP_BACKOFF', 0.5))
+HTTP_MAX_RETRY_AFTER = float(os.getenv('HTTP_MAX_RETRY_AFTER', 60))
+BREAKER_THRESHOLD = int(os.getenv('BREAKER_THRESHOLD', 5))
+BREAKER_COOLDOWN = float(os.getenv('BREAKER_COOLDOWN', 60))
+
+# live, record (every response is also written to the cassette) or replay (served from it)
+HTTP_TRANSPORT = os.getenv('HTTP_TRANSPORT', 'live')
+HTTP_CASSETTE = os.getenv('HTTP_CASSETTE', '.cache/cassette.sqlite')
+# Replay delay per response: latency in seconds plus body size over bandwidth in bytes/s (0 = unlimited)
+REPLAY_LATENCY = float(os.getenv('REPLAY_LATENCY', 0))
+REPLAY_BANDWIDTH = float(os.getenv('REPLAY_BANDWIDTH', 0))
+# Query parameters that never reach a cassette
+CASSETTE_PRIVATE_PARAMS = ('apiKey',)
+
+HTTP_CACHE_DIR = os.getenv('HTTP_CACHE_DIR', '.cache/http')
+HTTP_CACHE_FRESH = float(os.getenv('HTTP_CACHE_FRESH', 0))
+HTTP_CACHE_MAX_AGE = float(os.getenv('HTTP_CACHE_MAX_AGE', 14 * 24 * 60 * 60))
+HTTP_CACHE_MAX_BYTES = int(os.getenv('HTTP_CACHE_MAX_BYTES', 200 * 1024 * 1024))
+# Bump when a detail parser changes so previously extracted fields are not reused
+DETAIL_CACHE_VERSION = 3
+
+DETAIL_WORKERS = int(os.getenv('DETAIL_WORKERS', 8))
+LISTING_QUEUE_SIZE = int(os.getenv('LISTING_QUEUE_SIZE', 32))
+# Parse detail pages in this many worker processes instead of the fetching threads (0 = off)
+PARSE_PROCESSES = int(os.getenv('PARSE_PROCESSES', 0))
+
+# Agents share one executor; each gets a wall-clock deadline from when it starts and,
+# once cancelled, this long to stop before the run publishes without it (seconds)
+AGENT_WORKERS = int(os.getenv('AGENT_WORKERS', 6))
+AGENT_DEADLINE = float(os.getenv('AGENT_DEADLINE', 20 * 60))
+AGENT_CANCEL_GRACE = float(os.getenv('AGENT_CANCEL_GRACE', 60))
+
+# Each agent streams its properties to <OUTPUT_DIR>/<agent>.ndjson as they complete
+OUTPUT_DIR = os.getenv('OUTPUT_DIR', '.cache/output')
+COMBINED_PATH = os.getenv('COMBINED_PATH', 'combined.json')
+
+# Columnar map bundle and per-agent detail shards served with the site
+MAP_DATA_DIR = os.getenv('MAP_DATA_DIR', 'site/assets/data')
+# Recorded pages per agent: <dir>/<agent>/listing.* and detail.*
+BENCH_FIXTURES_DIR = os.getenv('BENCH_FIXTURES_DIR', 'bench/fixtures')
+BENCH_ROUNDS = int(os.getenv('BENCH_ROUNDS', 20))
+# Each timed round repeats a stage until it has run this long, so small pages aren't lost in timer noise
+BENCH_MIN_ROUND_SECONDS = float(os.getenv('BENCH_MIN_ROUND_SECONDS', 0.02))
+BENCH_TOLERANCE = float(os.getenv('BENCH_TOLERANCE', 0.15))
+# Web-mercator zoom of the tile index; 16 gives tiles of roughly 370m across at Selly Oak
+MAP_TILE_ZOOM = int(os.getenv('MAP_TILE_ZOOM', 16))
+# Fields the map only needs once a popup opens
+MAP_DETAIL_FIELDS = ('title', 'url', 'address', 'price', 'beds', 'baths', 'available_date', 'images', 'sources')
+
+# Listings from different agents with the same address key closer than this are merged (metres)
+DEDUP_RADIUS = float(os.getenv('DEDUP_RADIUS', 75))
+
+QUALITY_REPORT_PATH = os.getenv('QUALITY_REPORT_PATH', 'quality.json')
+# south,west,north,east; coordinates outside it are reported as invalid
+SELLY_OAK_BOUNDS = tuple(float(edge) for edge in os.getenv('SELLY_OAK_BOUNDS', '52.41,-1.98,52.49,-1.88').split(','))
+# Run gate as field=minimum coverage percent per agent, e.g. "lat=90,price=95" (empty = report only)
+QUALITY_GATE = os.getenv('QUALITY_GATE', '')
+QUALITY_FIELDS = ('lat', 'lon', 'price', 'beds', 'baths', 'available_date', 'address', 'status', 'images')
+
+GEOAPIFY_URL = os.getenv('GEOAPIFY_URL', 'https://api.geoapify.com/v1/geocode/search')
+GEOCODE_CACHE_PATH = os.getenv('GEOCODE_CACHE_PATH', '.cache/geocode.sqlite')
+GEOCODE_CACHE_TTL = float(os.getenv('GEOCODE_CACHE_TTL', 180 * 24 * 60 * 60))
+GEOCODE_NEGATIVE_TTL = float(os.getenv('GEOCODE_NEGATIVE_TTL', 7 * 24 * 60 * 60))
+GEOCODE_WORKERS = int(os.getenv('GEOCODE_WORKERS', 4))
+GEOCODE_RATE = float(os.getenv('GEOCODE_RATE', 5))
+GEOCODE_QUOTA = int(os.getenv('GEOCODE_QUOTA', 1000))
+
+GAZETTEER_PATH = os.getenv('GAZETTEER_PATH', 'gazetteer.csv')
+# Street centroids are only trusted for streets shorter than this radius (metres)
+GAZETTEER_MAX_STREET_RADIUS = float(os.getenv('GAZETTEER_MAX_STREET_RADIUS', 300))
+# Largest gap in house numbers that is interpolated between two known addresses
+GAZETTEER_MAX_NUMBER_GAP = int(os.getenv('GAZETTEER_MAX_NUMBER_GAP', 20))
+GAZETTEER_MAX_POSTCODE_RADIUS = float(os.getenv('GAZETTEER_MAX_POSTCODE_RADIUS', 250))
+# A house whose samples disagree by more than this (metres) is not trusted
+GAZETTEER_MAX_ADDRESS_RADIUS = float(os.getenv('GAZETTEER_MAX_ADDRESS_RADIUS', 50))
+# Street and postcode centroids need this many samples; one house says nothing about a street's extent
+GAZETTEER_MIN_SAMPLES = int(os.getenv('GAZETTEER_MIN_SAMPLES', 2))
+
+INCREMENTAL = os.getenv('INCREMENTAL', '0') == '1'
+PREVIOUS_SNAPSHOT = os.getenv('PREVIOUS_SNAPSHOT', 'combined.json')
+
 COLOURS = {
     "HEADER": "\033[95m",
     "BLUE": "\033[94m",
@@ -21,218 +116,1890 @@ COLOURS = {
     "UNDERLINE": "\033[4m"
 }
 
-def log(message, level="VERBOSE"):
-    if level == "VERBOSE":
-        print(f'[DEBUG] {message}')
+LOG_LEVELS = {"DEBUG": 10, "INFO": 20, "WARNING": 30, "ERROR": 40, "OFF": 100}
+# Text logs colour the level tag, so messages don't repeat the level themselves
+LOG_COLOURS = {"WARNING": "WARNING", "ERROR": "FAIL"}
+LOG_LEVEL = LOG_LEVELS[os.getenv('LOG_LEVEL', 'INFO').upper()]
+# text or json (one object per line)
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'text')
+# Per-property and per-request messages check this first, so when DEBUG is off they are never formatted
+LOG_DEBUG = LOG_LEVEL <= LOG_LEVELS["DEBUG"]
+REGEX_ANSI = re.compile(r'\x1b\[[0-9;]*m')
+
+RUN_REPORT_PATH = os.getenv('RUN_REPORT_PATH', 'run.json')
+METRICS_PATH = os.getenv('METRICS_PATH', 'metrics.prom')
+# When set, every pipeline stage is profiled into <dir>/<stage>.pstats
+PROFILE_DIR = os.getenv('PROFILE_DIR', '')
+HISTOGRAM_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+def set_logging(level=None, format=None):
+    global LOG_LEVEL, LOG_FORMAT, LOG_DEBUG
+    if level is not None:
+        LOG_LEVEL = LOG_LEVELS[level.upper()]
+    if format is not None:
+        LOG_FORMAT = format
+    LOG_DEBUG = LOG_LEVEL <= LOG_LEVELS["DEBUG"]
+
+def log(message, level="DEBUG", **fields):
+    if LOG_LEVELS[level] < LOG_LEVEL:
+        return
+    # One write per line so messages from worker threads don't interleave
+    if LOG_FORMAT == "json":
+        sys.stdout.write(json.dumps({"time": round(time.time(), 3), "level": level, "thread": threading.current_thread().name, "message": REGEX_ANSI.sub('', str(message)), **fields}, default=str) + "\n")
+    else:
+        tag = f"{COLOURS[LOG_COLOURS[level]]}{level}{COLOURS['ENDC']}" if level in LOG_COLOURS else level
+        sys.stdout.write(f'[{tag}] {message}\n')
+
+class metrics_registry():
+    # Counters, gauges and histograms keyed by name and labels. Updates take one lock and
+    # a dict lookup, cheap next to the request or parse they measure.
+    def __init__(self, buckets=HISTOGRAM_BUCKETS) -> None:
+        self.buckets = buckets
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.gauges[key] = value
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = {"counts": [0] * (len(self.buckets) + 1), "count": 0, "sum": 0.0}
+            histogram["counts"][bisect.bisect_left(self.buckets, value)] += 1
+            histogram["count"] += 1
+            histogram["sum"] += value
+
+    def reset(self):
+        with self.lock:
+            self.counters.clear()
+            self.gauges.clear()
+            self.histograms.clear()
+
+    def snapshot(self):
+        with self.lock:
+            return dict(self.counters), dict(self.gauges), {key: {**value, "counts": list(value["counts"])} for key, value in self.histograms.items()}
+
+    def value(self, name, **labels):
+        # Sum of a counter over every series matching the given labels
+        counters, _, _ = self.snapshot()
+        return sum(value for (series, series_labels), value in counters.items() if series == name and labels.items() <= dict(series_labels).items())
+
+    def prometheus(self, prefix="sellyhouses_"):
+        def series(name, labels, suffix="", extra=()):
+            pairs = ",".join(f'{label}="{str(value)}"' for label, value in tuple(labels) + tuple(extra))
+            return f"{prefix}{name}{suffix}{{{pairs}}}" if pairs else f"{prefix}{name}{suffix}"
+
+        counters, gauges, histograms = self.snapshot()
+        lines = []
+        for kind, values in (("counter", counters), ("gauge", gauges)):
+            typed = set()
+            # Label values can be of mixed types, so order by their text
+            for (name, labels), value in sorted(values.items(), key=str):
+                if name not in typed:
+                    lines.append(f"# TYPE {prefix}{name} {kind}")
+                    typed.add(name)
+                lines.append(f"{series(name, labels)} {value}")
+        typed = set()
+        for (name, labels), histogram in sorted(histograms.items(), key=str):
+            if name not in typed:
+                lines.append(f"# TYPE {prefix}{name} histogram")
+                typed.add(name)
+            total = 0
+            for bound, count in zip(self.buckets + ("+Inf",), histogram["counts"]):
+                total += count
+                lines.append(f"{series(name, labels, '_bucket', (('le', bound),))} {total}")
+            lines.append(f"{series(name, labels, '_sum')} {histogram['sum']}")
+            lines.append(f"{series(name, labels, '_count')} {histogram['count']}")
+        return "\n".join(lines) + "\n"
+
+METRICS = metrics_registry()
+
+@contextlib.contextmanager
+def stage(name, profile=True):
+    # Times a pipeline stage into stage_seconds and, with PROFILE_DIR set, profiles the
+    # calling thread for its duration
+    if not (profile and PROFILE_DIR):
+        profile = None
+    else:
+        import cProfile
+        profile = cProfile.Profile()
+        profile.enable()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        METRICS.set("stage_seconds", round(time.perf_counter() - start, 6), stage=name)
+        if profile is not None:
+            profile.disable()
+            os.makedirs(PROFILE_DIR, exist_ok=True)
+            profile.dump_stats(os.path.join(PROFILE_DIR, f"{name}.pstats"))
+
+class circuit_open(Exception):
+    pass
+
+def retry_after(resp):
+    value = resp.headers.get("Retry-After")
+    if not value:
+        return 0
+    try:
+        seconds = float(value)
+    except ValueError:
+        try:
+            seconds = email.utils.parsedate_to_datetime(value).timestamp() - time.time()
+        except (TypeError, ValueError):
+            return 0
+    return min(max(seconds, 0), HTTP_MAX_RETRY_AFTER)
+
+class host_limiter():
+    # Token bucket that halves its rate on 429/503 and creeps back up on success,
+    # plus a circuit breaker that opens after BREAKER_THRESHOLD consecutive failures
+    def __init__(self, host, rate=HTTP_RATE, burst=HTTP_BURST) -> None:
+        self.host = host
+        self.lock = threading.Lock()
+
+        self.max_rate = rate
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.blocked_until = 0
+
+        self.failures = 0
+        self.opened_at = None
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+
+                if self.opened_at is not None:
+                    if now - self.opened_at < BREAKER_COOLDOWN:
+                        raise circuit_open(f"Circuit open for {self.host}")
+                    # Half-open, a single further failure trips it again
+                    self.opened_at = None
+                    self.failures = BREAKER_THRESHOLD - 1
+
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+
+                wait = self.blocked_until - now
+                if wait <= 0:
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return
+                    wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def success(self):
+        with self.lock:
+            self.failures = 0
+            self.rate = min(self.max_rate, self.rate + 0.1 * self.max_rate)
+
+    def throttled(self, delay):
+        with self.lock:
+            self.rate = max(HTTP_MIN_RATE, self.rate / 2)
+            self.tokens = 0
+            self.blocked_until = max(self.blocked_until, time.monotonic() + delay)
+        log(f"[HTTP] {self.host} throttled, rate now {self.rate:.2f}/s", "INFO")
+
+    def failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.failures >= BREAKER_THRESHOLD and self.opened_at is None:
+                self.opened_at = time.monotonic()
+                log(f"[HTTP] Circuit opened for {self.host} after {self.failures} failures", "ERROR")
+
+class http_cache():
+    # Persistent response cache keyed by URL. Each entry keeps the validators, a digest of
+    # the body, the gzipped body and the fields a parser extracted from that body.
+    def __init__(self, path=HTTP_CACHE_DIR, fresh=HTTP_CACHE_FRESH, max_age=HTTP_CACHE_MAX_AGE, max_bytes=HTTP_CACHE_MAX_BYTES) -> None:
+        self.path = path
+        self.fresh = fresh
+        self.max_age = max_age
+        self.max_bytes = max_bytes
+        os.makedirs(path, exist_ok=True)
+
+    def key(self, url):
+        return os.path.join(self.path, hashlib.sha256(url.encode()).hexdigest())
+
+    def meta(self, url):
+        # The JSON sidecar on its own, for callers that don't need the body
+        try:
+            with open(self.key(url) + '.json', 'r') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return entry if entry.get('url') == url else None
+
+    def load(self, url):
+        entry = self.meta(url)
+        if entry is None:
+            return None
+        try:
+            with open(self.key(url) + '.body', 'rb') as f:
+                entry['body'] = gzip.decompress(f.read())
+        except (OSError, ValueError):
+            return None
+        return entry
+
+    def write(self, url, entry):
+        # Temporary names are per thread: the same URL can be stored by two workers at once
+        key = self.key(url)
+        tmp = f".{threading.get_ident()}.tmp"
+        meta = {k: v for k, v in entry.items() if k != 'body'}
+        if 'body' in entry:
+            with open(key + '.body' + tmp, 'wb') as f:
+                f.write(gzip.compress(entry['body']))
+            os.replace(key + '.body' + tmp, key + '.body')
+        with open(key + '.json' + tmp, 'w') as f:
+            json.dump(meta, f)
+        os.replace(key + '.json' + tmp, key + '.json')
+
+    def store(self, url, resp, previous=None):
+        digest = hashlib.sha256(resp.content).hexdigest()
+        entry = {
+            'url': url,
+            'etag': resp.headers.get('ETag'),
+            'last_modified': resp.headers.get('Last-Modified'),
+            'encoding': resp.encoding,
+            'content_type': resp.headers.get('Content-Type'),
+            'digest': digest,
+            'stored_at': time.time(),
+            'body': resp.content,
+        }
+        # Fields survive a re-download as long as the content is byte-for-byte the same
+        if previous is not None and previous.get('digest') == digest:
+            entry['fields'] = previous.get('fields', {})
+        self.write(url, entry)
+        return digest
+
+    def touch(self, url, entry):
+        entry['stored_at'] = time.time()
+        self.write(url, {k: v for k, v in entry.items() if k != 'body'})
+
+    def fields(self, url, key):
+        entry = self.meta(url)
+        if entry is None:
+            return None
+        return entry.get('fields', {}).get(key)
+
+    def store_fields(self, url, key, fields):
+        entry = self.meta(url)
+        if entry is None:
+            return
+        # Only the newest extraction per URL is worth keeping
+        entry['fields'] = {key: fields}
+        self.write(url, entry)
+
+    def prune(self):
+        # Drops entries past max_age, then the oldest entries until under max_bytes
+        entries = []
+        now = time.time()
+        for name in os.listdir(self.path):
+            if not name.endswith('.json'):
+                continue
+            key = os.path.join(self.path, name[:-5])
+            try:
+                stored_at = os.path.getmtime(key + '.json')
+            except OSError:
+                # Gone since the listing, e.g. replaced or pruned by another run
+                continue
+            try:
+                size = os.path.getsize(key + '.json') + os.path.getsize(key + '.body')
+            except OSError:
+                size = 0
+            entries.append((stored_at, size, key))
+
+        entries.sort()
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        for stored_at, size, key in entries:
+            if now - stored_at <= self.max_age and total <= self.max_bytes:
+                break
+            for suffix in ('.json', '.body'):
+                try:
+                    os.remove(key + suffix)
+                except OSError:
+                    pass
+            total -= size
+            removed += 1
+        log(f"[HTTP CACHE] Pruned {removed} entries, {total} bytes kept", "INFO")
+
+def cached_response(url, entry):
+    from requests import Response
+    resp = Response()
+    resp.status_code = 200
+    resp.url = url
+    resp._content = entry['body']
+    resp.encoding = entry.get('encoding')
+    if entry.get('content_type'):
+        resp.headers['Content-Type'] = entry['content_type']
+    resp.from_cache = True
+    resp.digest = entry['digest']
+    return resp
+
+def cassette_key(method, url):
+    parts = urllib.parse.urlsplit(url)
+    query = [(name, value) for name, value in urllib.parse.parse_qsl(parts.query, keep_blank_values=True) if name not in CASSETTE_PRIVATE_PARAMS]
+    return method + " " + urllib.parse.urlunsplit(parts._replace(query=urllib.parse.urlencode(query)))
+
+class cassette():
+    # SQLite store of recorded responses keyed by method and URL (minus private parameters).
+    # Bodies are kept decoded and gzipped; the newest recording of a URL wins.
+    DROPPED_HEADERS = ('content-encoding', 'content-length', 'transfer-encoding', 'set-cookie')
+
+    def __init__(self, path=HTTP_CASSETTE) -> None:
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, status INTEGER, reason TEXT, headers TEXT, body BLOB, elapsed REAL, recorded_at REAL)")
+
+    def put(self, method, url, resp, elapsed):
+        headers = {name: value for name, value in resp.headers.items() if name.lower() not in self.DROPPED_HEADERS}
+        row = (cassette_key(method, url), resp.status_code, resp.reason, json.dumps(headers), gzip.compress(resp.content), elapsed, time.time())
+        with self.lock:
+            self.db.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?)", row)
+            self.db.commit()
+
+    def get(self, method, url):
+        with self.lock:
+            row = self.db.execute("SELECT status, reason, headers, body FROM responses WHERE key = ?", (cassette_key(method, url),)).fetchone()
+        if row is None:
+            return None
+        return {"status": row[0], "reason": row[1], "headers": json.loads(row[2]), "body": gzip.decompress(row[3])}
+
+    def count(self):
+        with self.lock:
+            return self.db.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+class cassette_transport():
+    # Transport adapter mounted on the client's session in place of the HTTP adapter. Record
+    # mode sends through the real adapter and keeps a copy; replay never touches the network
+    # and answers a miss with a 404 so nothing retries.
+    def __init__(self, store, mode, adapter=None, latency=REPLAY_LATENCY, bandwidth=REPLAY_BANDWIDTH) -> None:
+        self.store = store
+        self.mode = mode
+        self.adapter = adapter
+        self.latency = latency
+        self.bandwidth = bandwidth
+
+    def send(self, request, **kwargs):
+        if self.mode == "record":
+            # Session.send only sets resp.elapsed after the adapter returns, so time it here,
+            # body included
+            start = time.perf_counter()
+            resp = self.adapter.send(request, **kwargs)
+            resp.content
+            self.store.put(request.method, request.url, resp, time.perf_counter() - start)
+            return resp
+
+        entry = self.store.get(request.method, request.url)
+        if entry is None:
+            log(f"[CASSETTE] No recording for {cassette_key(request.method, request.url)}", "WARNING")
+            entry = {"status": 404, "reason": "Not Found", "headers": {"X-Cassette": "miss"}, "body": b""}
+
+        delay = self.latency + (len(entry["body"]) / self.bandwidth if self.bandwidth else 0)
+        if delay:
+            time.sleep(delay)
+        return self.response(request, entry, delay)
+
+    def response(self, request, entry, delay):
+        from requests import Response
+        from requests.structures import CaseInsensitiveDict
+        from requests.utils import get_encoding_from_headers
+        resp = Response()
+        resp.status_code = entry["status"]
+        resp.reason = entry["reason"]
+        resp.headers = CaseInsensitiveDict(entry["headers"])
+        resp.encoding = get_encoding_from_headers(resp.headers)
+        resp._content = entry["body"]
+        resp.url = request.url
+        resp.request = request
+        resp.elapsed = datetime.timedelta(seconds=delay)
+        return resp
+
+    def close(self):
+        if self.adapter is not None:
+            self.adapter.close()
+        self.store.close()
+
+class http_client():
+    # One keep-alive pool per host, shared by every agent and the geocoder
+    def __init__(self, pool_connections=HTTP_POOL_CONNECTIONS, pool_maxsize=HTTP_POOL_MAXSIZE, timeout=HTTP_TIMEOUT, retries=HTTP_RETRIES, backoff=HTTP_BACKOFF, cache_dir=HTTP_CACHE_DIR, transport=HTTP_TRANSPORT, cassette_path=HTTP_CASSETTE) -> None:
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+
+        # A recording has to see every response in full, so the disk cache (fresh entries,
+        # 304 revalidation) is bypassed while recording
+        if transport == "record":
+            cache_dir = ''
+
+        self.cache = http_cache(cache_dir) if cache_dir else None
+
+        self.limiters = {}
+        self.limiters_lock = threading.Lock()
+        self.host_rates = {urllib.parse.urlsplit(GEOAPIFY_URL).netloc: GEOCODE_RATE}
+
+        from requests import Session
+        from requests.adapters import HTTPAdapter
+        self.session = Session()
+        self.session.headers["Accept-Encoding"] = "gzip, deflate"
+
+        adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize)
+        if transport != "live":
+            adapter = cassette_transport(cassette(cassette_path), transport, adapter)
+            log(f"[CASSETTE] {transport.capitalize()}ing {cassette_path}", "INFO")
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def limiter(self, url):
+        host = urllib.parse.urlsplit(url).netloc
+        with self.limiters_lock:
+            if host not in self.limiters:
+                rate = self.host_rates.get(host, HTTP_RATE)
+                self.limiters[host] = host_limiter(host, rate, min(HTTP_BURST, max(1, int(rate))))
+            return self.limiters[host]
+
+    def get(self, url, raise_for_status=True, cache=False, **kwargs):
+        # With cache=True the response may come from disk; resp.digest identifies its content
+        if not cache or self.cache is None:
+            return self.request(url, raise_for_status, **kwargs)
+
+        entry = self.cache.load(url)
+        if entry is not None and time.time() - entry['stored_at'] < self.cache.fresh:
+            return cached_response(url, entry)
+
+        headers = dict(kwargs.pop("headers", None) or {})
+        if entry is not None:
+            if entry.get('etag'):
+                headers["If-None-Match"] = entry['etag']
+            if entry.get('last_modified'):
+                headers["If-Modified-Since"] = entry['last_modified']
+
+        resp = self.request(url, raise_for_status, headers=headers, **kwargs)
+        if resp.status_code == 304 and entry is not None:
+            self.cache.touch(url, entry)
+            return cached_response(url, entry)
+
+        resp.from_cache = False
+        resp.digest = None
+        if resp.status_code == 200:
+            resp.digest = self.cache.store(url, resp, entry)
+        return resp
+
+    def request(self, url, raise_for_status=True, **kwargs):
+        # Retries timeouts, connection errors, 429 and 5xx with jittered exponential backoff
+        from requests import RequestException
+        kwargs.setdefault("timeout", self.timeout)
+        limiter = self.limiter(url)
+
+        for attempt in range(self.retries + 1):
+            limiter.acquire()
+            resp = None
+            try:
+                resp = self.session.get(url, **kwargs)
+            except RequestException as e:
+                limiter.failure()
+                METRICS.inc("http_requests_total", host=limiter.host, status="error")
+                error = e
+            else:
+                METRICS.inc("http_requests_total", host=limiter.host, status=str(resp.status_code))
+                if resp.status_code in (429, 503):
+                    limiter.throttled(retry_after(resp))
+                elif resp.status_code >= 500:
+                    limiter.failure()
+                else:
+                    limiter.success()
+                    break
+
+            if attempt < self.retries:
+                METRICS.inc("http_retries_total", host=limiter.host)
+                log(f"[HTTP] Retrying {url} ({attempt + 1}/{self.retries})", "INFO")
+                time.sleep(random.uniform(0, self.backoff * 2 ** attempt))
+
+        if resp is None:
+            raise error
+        if raise_for_status:
+            resp.raise_for_status()
+        return resp
+
+    def close(self):
+        self.session.close()
+
+HTTP = None
+HTTP_LOCK = threading.Lock()
+
+def default_client():
+    global HTTP
+    with HTTP_LOCK:
+        if HTTP is None:
+            HTTP = http_client()
+    return HTTP
+
+def guard_detail(fetch):
+    # A failed detail page keeps the listing data; an open circuit aborts the agent
+    from requests import RequestException
+
+    def guarded(property, index, total):
+        try:
+            return fetch(property, index, total)
+        except RequestException as e:
+            log(f"Could not fetch details for {property['title']}: {e}", "ERROR")
+            return property
+    return guarded
+
+def stream_details(pages, parse_page, fetch, workers=DETAIL_WORKERS, queue_size=LISTING_QUEUE_SIZE):
+    # Producer/consumer pipeline: parse_page(page) runs on a producer thread and every
+    # card it returns is handed to the detail workers through a bounded queue, so listing
+    # and detail fetches overlap. Enriched properties are yielded in listing order.
+    from requests import RequestException
+    cards = queue.Queue(maxsize=queue_size)
+    stop = threading.Event()
+    ready = threading.Condition()
+    results = {}
+    state = {"queued": 0, "total": None, "error": None}
+    guarded = guard_detail(fetch)
+    if workers <= 0:
+        # Inline: listing and detail work stay on the calling thread (profiling)
+        index = 0
+        for page in pages:
+            try:
+                page_properties = parse_page(page)
+            except RequestException as e:
+                log(f"Could not fetch listing page {page}: {e}", "ERROR")
+                continue
+            for property in page_properties:
+                yield guarded(property, index, index + 1)
+                index += 1
+        return
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                cards.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def fail(error):
+        with ready:
+            if state["error"] is None:
+                state["error"] = error
+            ready.notify_all()
+        stop.set()
+
+    def produce():
+        try:
+            for page in pages:
+                try:
+                    page_properties = parse_page(page)
+                except RequestException as e:
+                    log(f"Could not fetch listing page {page}: {e}", "ERROR")
+                    continue
+
+                for property in page_properties:
+                    if not put((state["queued"], property)):
+                        return
+                    state["queued"] += 1
+        except Exception as e:
+            fail(e)
+        finally:
+            with ready:
+                state["total"] = state["queued"]
+                ready.notify_all()
+            for _ in range(workers):
+                put(None)
+
+    def consume():
+        while not stop.is_set():
+            try:
+                item = cards.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            if item is None:
+                return
+
+            index, property = item
+            try:
+                property = guarded(property, index, state["total"] or state["queued"])
+            except Exception as e:
+                fail(e)
+                return
+            with ready:
+                results[index] = property
+                ready.notify_all()
+
+    threads = [threading.Thread(target=produce, daemon=True)]
+    threads += [threading.Thread(target=consume, daemon=True) for _ in range(workers)]
+    for thread in threads:
+        thread.start()
 
-def geocode_property(property):
-    log(f"Geocoding {property['title']}")
-    
     try:
-        url = "https://api.geoapify.com/v1/geocode/search?"
-        
-        if 'address' in property:
-            params = {"text": property['address'] + " United Kingdom", "apiKey": GEOAPIFY_API_KEY}
-        elif 'title' in property:
-            log(f"Geocoding {property['title']} no address")
-            if 'source' in property:
-                if property['source'] == "Easy Lettings":
-                    params = {"text": property['title'] + " Birmingham, United Kingdom", "apiKey": GEOAPIFY_API_KEY}
+        index = 0
+        while True:
+            with ready:
+                while index not in results and state["error"] is None and (state["total"] is None or index < state["total"]):
+                    ready.wait()
+                if index in results:
+                    property = results.pop(index)
+                elif state["error"] is not None:
+                    raise state["error"]
                 else:
-                    params = {"text": property['title'] + " Birmingham, United Kingdom", "apiKey": GEOAPIFY_API_KEY}
-            log(f"Geocoding {property['title']} with params {params}")
+                    return
+            yield property
+            index += 1
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+class geocode_cache():
+    # SQLite cache of Geoapify results keyed by normalised query text. Misses are cached
+    # too (found = 0) but expire sooner so new addresses get another chance.
+    def __init__(self, path=GEOCODE_CACHE_PATH, ttl=GEOCODE_CACHE_TTL, negative_ttl=GEOCODE_NEGATIVE_TTL) -> None:
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.lock = threading.Lock()
+
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("CREATE TABLE IF NOT EXISTS geocodes (query TEXT PRIMARY KEY, found INTEGER, lat REAL, lon REAL, formatted TEXT, stored_at REAL)")
+        self.expire()
+
+    def get(self, query):
+        # Returns (hit, result) where result is None for a cached miss
+        with self.lock:
+            row = self.db.execute("SELECT found, lat, lon, formatted FROM geocodes WHERE query = ?", (query,)).fetchone()
+        if row is None:
+            return False, None
+        if not row[0]:
+            return True, None
+        return True, {"lat": row[1], "lon": row[2], "formatted": row[3]}
+
+    def put(self, query, result):
+        with self.lock:
+            if result is None:
+                self.db.execute("INSERT OR REPLACE INTO geocodes VALUES (?, 0, NULL, NULL, NULL, ?)", (query, time.time()))
+            else:
+                self.db.execute("INSERT OR REPLACE INTO geocodes VALUES (?, 1, ?, ?, ?, ?)", (query, result['lat'], result['lon'], result['formatted'], time.time()))
+            self.db.commit()
+
+    def results(self):
+        with self.lock:
+            rows = self.db.execute("SELECT query, lat, lon, formatted FROM geocodes WHERE found = 1").fetchall()
+        return {row[0]: {"lat": row[1], "lon": row[2], "formatted": row[3]} for row in rows}
+
+    def expire(self):
+        now = time.time()
+        with self.lock:
+            self.db.execute("DELETE FROM geocodes WHERE (found = 1 AND stored_at < ?) OR (found = 0 AND stored_at < ?)", (now - self.ttl, now - self.negative_ttl))
+            self.db.commit()
+
+GEOCODE_CACHE = None
+GEOCODE_CACHE_LOCK = threading.Lock()
+
+def default_geocode_cache():
+    global GEOCODE_CACHE
+    with GEOCODE_CACHE_LOCK:
+        if GEOCODE_CACHE is None and GEOCODE_CACHE_PATH:
+            GEOCODE_CACHE = geocode_cache()
+    return GEOCODE_CACHE
+
+def geocode_text(property):
+    if property.get('address', "Unknown") != "Unknown":
+        return property['address'] + " United Kingdom"
+    return property['title'] + " Birmingham, United Kingdom"
+
+def normalise_query(text):
+    return " ".join(re.sub(r'[^a-z0-9 ]', ' ', text.lower()).split())
+
+def apply_geocode(property, result):
+    if result.get('formatted') and property.get('address', "Unknown") == "Unknown":
+        property['address'] = result['formatted']
+    property['lat'] = result['lat']
+    property['lon'] = result['lon']
+    # Only gazetteer results carry a precision; build_gazetteer() leaves those out
+    if result.get('precision'):
+        property['geocode_precision'] = result['precision']
+    return property
 
-        url += urllib.parse.urlencode(params)
-        if 'title' in property:
-            log(f"Geocoding {property['title']} with url {url}")
+def geocode_request(text, client):
+    # One Geoapify lookup. Returns (definitive, result): definitive is False when the
+    # answer should not be cached (auth errors, quota, server errors)
+    url = GEOAPIFY_URL + "?" + urllib.parse.urlencode({"text": text, "apiKey": GEOAPIFY_API_KEY})
+    if LOG_DEBUG:
+        log(f"Geocoding with url {url}")
 
-        headers = CaseInsensitiveDict()
-        headers["Accept"] = "application/json"
+    resp = client.get(url, headers={"Accept": "application/json"}, raise_for_status=False)
 
-        resp = get(url, headers=headers)
+    # Error bodies (HTML 5xx pages, a replay miss) are often not JSON, so the status comes first
+    if resp.status_code == 401:
+        log(f"Geocoding status 401 for {text}. Check API key.", "ERROR")
 
-        if resp.status_code == 401:
-            log(f"ERROR - Geocoding status 401 for {property}. Check API key.")
-        
-        if 'address' not in property:
-            property['address'] = resp.json()['features'][0]['properties']['formatted']
-        if resp.status_code == 200:
-            # pass
-            # property['location'] = resp.json()['features'][0]['properties']['address']
-            property['lat'] = resp.json()['features'][0]['properties']['lat']
-            property['lon'] = resp.json()['features'][0]['properties']['lon']
-        else:
-            if 'title' in property:
-                log(f"ERROR - Geocoding status not 200 for {property['title']}, status code {resp.status_code}")
-            log(f"ERROR - Geocoding status not 200. Geocodify response: {resp.json()}")
+    if resp.status_code != 200:
+        log(f"Geocoding status not 200 for {text}, status code {resp.status_code}", "ERROR")
+        log(f"Geocoding status not 200. Geocodify response: {resp.text[:200]!r}", "ERROR")
+        return False, None
+
+    try:
+        data = resp.json()
+    except ValueError:
+        log(f"Geocoding response for {text} is not JSON: {resp.text[:200]!r}", "ERROR")
+        return False, None
+
+    features = data.get('features') or []
+    if not features:
+        log(f"Geocoding found nothing for {text}", "ERROR")
+        return True, None
+    return True, {key: features[0]['properties'].get(key) for key in ('lat', 'lon', 'formatted')}
+
+def geocode_property(property, client=None, cache=None):
+    client = client or default_client()
+    cache = cache or default_geocode_cache()
+
+    if LOG_DEBUG:
+        log(f"Geocoding {property['title']}")
+    
+    try:
+        text = geocode_text(property)
+        query = normalise_query(text)
+
+        result = default_gazetteer().lookup(text)
+        if result:
+            if LOG_DEBUG:
+                log(f"Geocoding {property['title']} from the gazetteer ({result['precision']})")
+            METRICS.inc("geocode_lookups_total", result="gazetteer")
+            return apply_geocode(property, result)
+
+        if cache is not None:
+            hit, result = cache.get(query)
+            if hit:
+                if LOG_DEBUG:
+                    log(f"Geocoding {property['title']} from cache ({'hit' if result else 'known miss'})")
+                METRICS.inc("geocode_lookups_total", result="cache_hit" if result else "cache_known_miss")
+                return apply_geocode(property, result) if result else property
+
+        definitive, result = geocode_request(text, client)
+        METRICS.inc("geocode_lookups_total", result="found" if result else "not_found" if definitive else "error")
+        if definitive and cache is not None:
+            cache.put(query, result)
+        if result:
+            apply_geocode(property, result)
     except:
-        log(f"ERROR - Could not find more information about {property}")
+        log(f"Could not find more information about {property}", "ERROR")
+    return property
+
+REGEX_POSTCODE = re.compile(r'\b([a-z]{1,2}[0-9][a-z0-9]?) ?([0-9][a-z]{2})\b')
+REGEX_STREET_ADDRESS = re.compile(r'(?:\b([0-9]+)[a-z]?,? +)?\b((?:[a-z]+ +){0,3}(?:road|rd|lane|ln|drive|dr|close|avenue|ave|gardens|street|st|grove|crescent|place|way|walk|park|hill|terrace|row|mews|square|view))\b')
+STREET_ABBREVIATIONS = {"rd": "road", "ln": "lane", "dr": "drive", "ave": "avenue", "st": "street"}
+
+def normalise_street(street):
+    words = street.split()
+    words[-1] = STREET_ABBREVIATIONS.get(words[-1], words[-1])
+    return " ".join(words)
+
+def parse_location(text):
+    # Pulls (postcode, house number, street) out of a free-text title or address
+    text = text.lower()
+
+    postcode = REGEX_POSTCODE.search(text)
+    if postcode:
+        postcode = f"{postcode.group(1)} {postcode.group(2)}"
+
+    number, street = None, None
+    address = REGEX_STREET_ADDRESS.search(text)
+    if address:
+        number, street = address.group(1), normalise_street(address.group(2))
+    return postcode, number, street
+
+def distance(lat1, lon1, lat2, lon2):
+    # Equirectangular approximation in metres, plenty for neighbourhood-scale distances
+    x = math.radians(lon2 - lon1) * math.cos(math.radians((lat1 + lat2) / 2))
+    y = math.radians(lat2 - lat1)
+    return math.hypot(x, y) * 6371000
+
+class gazetteer():
+    # Offline lookup of postcode, street and street-address centroids loaded from a CSV
+    # with columns kind,key,lat,lon,radius,count. Every index is a plain dict.
+    def __init__(self, path=GAZETTEER_PATH) -> None:
+        self.index = {"address": {}, "postcode": {}, "street": {}}
+        # {street: {parity: sorted [(number, lat, lon)]}} for interpolating between known houses
+        self.numbers = {}
+        try:
+            with open(path, 'r', newline='') as f:
+                for row in csv.DictReader(f):
+                    self.index[row['kind']][row['key']] = (float(row['lat']), float(row['lon']), float(row['radius']), int(row.get('count') or 1))
+        except OSError:
+            log(f"[GAZETTEER] No gazetteer at {path}, every lookup will go to Geoapify", "INFO")
+
+        for key, (lat, lon, radius, _) in self.index["address"].items():
+            if radius > GAZETTEER_MAX_ADDRESS_RADIUS:
+                continue
+            street, number = key.split('|')
+            self.numbers.setdefault(street, {}).setdefault(int(number) % 2, []).append((int(number), lat, lon))
+        for parities in self.numbers.values():
+            for houses in parities.values():
+                houses.sort()
+        self.streets = list(self.index["street"])
+
+    def interpolate(self, street, number):
+        houses = self.numbers.get(street, {}).get(number % 2, [])
+        position = bisect.bisect_left(houses, (number,))
+        if position == 0 or position == len(houses):
+            return None
+
+        (low, lat1, lon1), (high, lat2, lon2) = houses[position - 1], houses[position]
+        if high - low > GAZETTEER_MAX_NUMBER_GAP:
+            return None
+        fraction = (number - low) / (high - low)
+        return lat1 + (lat2 - lat1) * fraction, lon1 + (lon2 - lon1) * fraction
+
+    def match_street(self, street):
+        if street in self.index["street"]:
+            return street
+        matches = difflib.get_close_matches(street, self.streets, n=1, cutoff=0.85)
+        if not matches:
+            return None
+        # A word that only gains or loses letters at its end (George/Georges Road) names a
+        # different street, not a typo of the same one
+        words, known = street.split(), matches[0].split()
+        if len(words) != len(known):
+            return None
+        for word, known_word in zip(words, known):
+            if word != known_word and (word.startswith(known_word) or known_word.startswith(word)):
+                return None
+        return matches[0]
+
+    def lookup(self, text):
+        postcode, number, street = parse_location(text)
+
+        if street:
+            street = self.match_street(street)
+        if street and number:
+            if f"{street}|{number}" in self.index["address"]:
+                lat, lon, radius, _ = self.index["address"][f"{street}|{number}"]
+                if radius <= GAZETTEER_MAX_ADDRESS_RADIUS:
+                    return {"lat": lat, "lon": lon, "formatted": None, "precision": "address"}
+
+            point = self.interpolate(street, int(number))
+            if point:
+                return {"lat": round(point[0], 6), "lon": round(point[1], 6), "formatted": None, "precision": "interpolated"}
+
+        if postcode in self.index["postcode"]:
+            lat, lon, radius, count = self.index["postcode"][postcode]
+            if count >= GAZETTEER_MIN_SAMPLES and radius <= GAZETTEER_MAX_POSTCODE_RADIUS:
+                return {"lat": lat, "lon": lon, "formatted": None, "precision": "postcode"}
+
+        if street:
+            lat, lon, radius, count = self.index["street"][street]
+            if count >= GAZETTEER_MIN_SAMPLES and radius <= GAZETTEER_MAX_STREET_RADIUS:
+                return {"lat": lat, "lon": lon, "formatted": None, "precision": "street"}
+        return None
+
+GAZETTEER = None
+GAZETTEER_LOCK = threading.Lock()
+
+def default_gazetteer():
+    global GAZETTEER
+    with GAZETTEER_LOCK:
+        if GAZETTEER is None:
+            GAZETTEER = gazetteer()
+    return GAZETTEER
+
+def build_gazetteer(properties, path=GAZETTEER_PATH):
+    # Rebuilds the gazetteer CSV from properties whose coordinates came from Geoapify or the
+    # agent. Coordinates the gazetteer itself supplied are left out so its guesses don't
+    # come back as evidence.
+    points = {"address": {}, "postcode": {}, "street": {}}
+    for property in properties:
+        if property.get('geocode_precision'):
+            continue
+        try:
+            lat, lon = float(property['lat']), float(property['lon'])
+        except (KeyError, TypeError, ValueError):
+            continue
+
+        # The title usually has the street and number, a Geoapify address the postcode
+        found_postcode, found_street = None, None
+        for text in (property.get('title', ''), property.get('address', '')):
+            postcode, number, street = parse_location(str(text))
+            if postcode and not found_postcode:
+                found_postcode = postcode
+                points["postcode"].setdefault(postcode, []).append((lat, lon))
+            if street and not found_street:
+                found_street = street
+                points["street"].setdefault(street, []).append((lat, lon))
+                if number:
+                    points["address"].setdefault(f"{street}|{number}", []).append((lat, lon))
+
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(["kind", "key", "lat", "lon", "radius", "count"])
+        for kind in ("postcode", "street", "address"):
+            for key in sorted(points[kind]):
+                coordinates = points[kind][key]
+                lat = sum(point[0] for point in coordinates) / len(coordinates)
+                lon = sum(point[1] for point in coordinates) / len(coordinates)
+                radius = max(distance(lat, lon, point[0], point[1]) for point in coordinates)
+                writer.writerow([kind, key, f"{lat:.6f}", f"{lon:.6f}", f"{radius:.0f}", len(coordinates)])
+
+def geocode_stage(properties, client=None, cache=None, workers=GEOCODE_WORKERS, quota=GEOCODE_QUOTA, force_titles=(), places=None):
+    # Geocodes every property without coordinates (plus any in force_titles) in one
+    # parallel round. Identical queries are sent once and the result is merged back
+    # into every property that produced that query.
+    client = client or default_client()
+    cache = cache or default_geocode_cache()
+    places = places or default_gazetteer()
+
+    groups = {}
+    local = 0
+    for property in properties:
+        # Agents write "Unknown" when a page has no coordinates, which is as good as missing
+        if known(property.get('lat')) and known(property.get('lon')) and property.get('title') not in force_titles:
+            continue
+        text = geocode_text(property)
+
+        # Forced titles are the ones whose agent coordinates are known to be wrong,
+        # so they always go to Geoapify rather than a gazetteer built from agent data
+        if property.get('title') not in force_titles:
+            result = places.lookup(text)
+            if result:
+                apply_geocode(property, result)
+                local += 1
+                continue
+        groups.setdefault(normalise_query(text), (text, []))[1].append(property)
+    log(f"Geocoded {local} properties from the gazetteer", "INFO")
+    METRICS.inc("geocode_lookups_total", local, result="gazetteer")
+
+    pending = []
+    for query, (text, group) in groups.items():
+        if cache is not None:
+            hit, result = cache.get(query)
+            if hit:
+                METRICS.inc("geocode_lookups_total", result="cache_hit" if result else "cache_known_miss")
+                if result:
+                    for property in group:
+                        apply_geocode(property, result)
+                continue
+        pending.append((query, text, group))
+
+    if len(pending) > quota:
+        METRICS.inc("geocode_lookups_total", len(pending) - quota, result="over_quota")
+        log(f"Geocoding {len(pending)} queries exceeds quota of {quota}, skipping {len(pending) - quota}", "WARNING")
+        pending = pending[:quota]
+
+    log(f"Geocoding {len(groups)} distinct queries, {len(groups) - len(pending)} from cache, {len(pending)} from Geoapify", "INFO")
+
+    def lookup(item):
+        query, text, group = item
+        try:
+            definitive, result = geocode_request(text, client)
+        except Exception as e:
+            METRICS.inc("geocode_lookups_total", result="error")
+            log(f"Could not geocode {text}: {e!r}", "ERROR")
+            return
+        METRICS.inc("geocode_lookups_total", result="found" if result else "not_found" if definitive else "error")
+        if definitive and cache is not None:
+            cache.put(query, result)
+        if result:
+            for property in group:
+                apply_geocode(property, result)
+
+    if pending:
+        with ThreadPoolExecutor(max_workers=max(1, min(workers, len(pending)))) as executor:
+            list(executor.map(lookup, pending))
+    return properties
+
+HTML_PARSERS = threading.local()
+
+def parse_html(content, encoding):
+    # Parses response bytes directly, decoded with the same charset requests would use for .text
+    from lxml import html as lxml_html
+    parsers = HTML_PARSERS.__dict__
+    if encoding not in parsers:
+        parsers[encoding] = lxml_html.HTMLParser(encoding=encoding)
+    return lxml_html.document_fromstring(content, parser=parsers[encoding])
+
+class xpath():
+    # XPath compiled on first use. has-class('x') matches a whitespace-separated class token,
+    # the way BeautifulSoup's class_='x' does; @class='a b' style exact matches use class-is().
+    def __init__(self, expression) -> None:
+        expression = re.sub(r"has-class\('([^']+)'\)", lambda m: f"contains(concat(' ', normalize-space(@class), ' '), ' {m.group(1)} ')", expression)
+        expression = re.sub(r"class-is\('([^']+)'\)", lambda m: f"normalize-space(@class)='{m.group(1)}'", expression)
+        self.expression = expression
+        self.compiled = None
+
+    def __call__(self, element):
+        if self.compiled is None:
+            from lxml import etree
+            self.compiled = etree.XPath(self.expression, smart_strings=False)
+        return self.compiled(element)
+
+XPATH_STRING = xpath('string()')
+
+def text(element):
+    return XPATH_STRING(element)
+
+def script_text(script):
+    return script.text or ""
+
+def split_coordinates(property, raw, separator):
+    # Mirrors the old split-and-index parsing: lat is set even if lon is missing
+    raw = raw.split(separator)
+    property['lat'] = raw[0].strip()
+    if len(raw) < 2:
+        return False
+    property['lon'] = raw[1].strip()
+    return True
+
+REGEX_LEAFLET_MARKER = re.compile(r'L\.marker\(\[((?:(?!\]\)).)*)', re.S)
+REGEX_LEAFLET_VIEW = re.compile(r'setView\(\[((?:(?!\],).)*)', re.S)
+REGEX_LATLNG = re.compile(r'LatLng\(([^)]*)')
+REGEX_GOOGLE_LATLNG = re.compile(r'google\.maps\.LatLng\(([^)]*)')
+
+XPATH_SCRIPTS = xpath("//script")
+
+MONTHS = {month: number for number, month in enumerate(('jan', 'feb', 'mar', 'apr', 'may', 'jun', 'jul', 'aug', 'sep', 'oct', 'nov', 'dec'), 1)}
+REGEX_MONTH = '(' + '|'.join(MONTHS) + r')[a-z]*\.?'
+# One pass over the lower-cased document, anchored on the literal "available" so the scan
+# skips ahead like a substring search. Numeric dates are UK day-first; "1st September"
+# without a year means the next one, a bare month needs a year to count.
+REGEX_AVAILABLE = re.compile(
+    r'available\b[\s:]*(?:from\b[\s:]*)?(?:'
+    r'(?P<now>now|immediately)\b'
+    r'|(?P<iy>\d{4})-(?P<im>\d{1,2})-(?P<id>\d{1,2})\b'
+    r'|(?P<nd>\d{1,2})[/.-](?P<nm>\d{1,2})[/.-](?P<ny>\d{4}|\d{2})\b'
+    r'|(?P<td>\d{1,2})(?:st|nd|rd|th)?\s+(?:of\s+)?' + REGEX_MONTH.replace('(', '(?P<tm>', 1) + r'(?:,?\s+(?P<ty>\d{4})\b)?'
+    r'|' + REGEX_MONTH.replace('(', '(?P<mm>', 1) + r',?\s+(?P<my>\d{4})\b'
+    r')')
+
+def available_match(found, today):
+    if found.group('now'):
+        return today
+    if found.group('iy'):
+        year, month, day = found.group('iy'), found.group('im'), found.group('id')
+    elif found.group('ny'):
+        year, month, day = found.group('ny'), found.group('nm'), found.group('nd')
+        if len(year) == 2:
+            year = '20' + year
+    elif found.group('tm'):
+        year, month, day = found.group('ty'), MONTHS[found.group('tm')], found.group('td')
+    else:
+        year, month, day = found.group('my'), MONTHS[found.group('mm')], 1
+    try:
+        if year is None:
+            date = datetime.date(today.year, int(month), int(day))
+            return date if date >= today else date.replace(year=today.year + 1)
+        return datetime.date(int(year), int(month), int(day))
+    except ValueError:
+        return None
+
+def extract_available_date(text, today=None):
+    # Returns an ISO date or "Unknown". Like the old line-by-line loop, a later mention wins.
+    today = today or datetime.date.today()
+    available = "Unknown"
+    for found in REGEX_AVAILABLE.finditer(text.lower()):
+        date = available_match(found, today)
+        if date is not None:
+            available = date.isoformat()
+    return available
+
+PARSE_POOL = None
+PARSE_POOL_LOCK = threading.Lock()
+PARSE_AGENTS = {}
+
+def parse_pool(processes=None):
+    global PARSE_POOL
+    processes = PARSE_PROCESSES if processes is None else processes
+    if processes <= 0 or PROFILE_DIR:
+        return None
+    with PARSE_POOL_LOCK:
+        if PARSE_POOL is None:
+            # Forking while the agent and HTTP threads hold locks can deadlock the child,
+            # so workers start from a clean interpreter
+            PARSE_POOL = ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context("spawn"))
+        return PARSE_POOL
+
+def close_parse_pool():
+    global PARSE_POOL
+    with PARSE_POOL_LOCK:
+        if PARSE_POOL is not None:
+            PARSE_POOL.shutdown()
+            PARSE_POOL = None
+
+def parse_remote(agent_name, method, content, encoding, property):
+    # Runs in a worker process: only the raw bytes and the listing card come in and only
+    # the extracted record goes back, the parsed tree never crosses the process boundary
+    if agent_name not in PARSE_AGENTS:
+        # Parsers never fetch, so an empty fixture client stands in for the HTTP session and caches
+        PARSE_AGENTS[agent_name] = AGENTS[agent_name](fixture_client(None))
+    agent = PARSE_AGENTS[agent_name]
+    return getattr(agent, method)(parse_html(content, encoding), property)
+
+LISTING_FIELDS = ('title', 'source', 'address', 'url', 'price', 'status', 'beds', 'baths', 'lat', 'lon', 'available_date', 'images', 'price_pw', 'beds_count', 'baths_count', 'sources')
+LISTING_SLOTS = frozenset(LISTING_FIELDS)
+UNSET = object()
+
+class listing(MutableMapping):
+    # One scraped property. The fields every agent fills live in slots and anything else an
+    # agent adds goes to extras, so a record is a fraction of a dict's size. It reads and
+    # writes like a dict so the parsers keep using property['field'].
+    __slots__ = LISTING_FIELDS + ('extras',)
+
+    title: str
+    source: str
+    address: str
+    url: str
+    price: str
+    status: str
+    # As scraped: text, a number from a JSON feed, or the text split across several nodes
+    beds: Union[str, int, list]
+    baths: Union[str, int, list]
+    # Text from the agent's page, float once geocoded or normalised
+    lat: Union[str, float]
+    lon: Union[str, float]
+    available_date: str
+    images: list
+    # Set by normalise_property(), None when the raw field can't be read
+    price_pw: Optional[float]
+    beds_count: Optional[int]
+    baths_count: Optional[int]
+    sources: list
+    extras: Optional[dict]
+
+    def __init__(self, fields=None) -> None:
+        self.extras = None
+        if fields:
+            self.update(fields)
+
+    @classmethod
+    def from_json(cls, data):
+        return cls(data)
+
+    def to_json(self):
+        data = {}
+        for field in LISTING_FIELDS:
+            value = getattr(self, field, UNSET)
+            if value is not UNSET:
+                data[field] = value
+        if self.extras:
+            data.update(self.extras)
+        return data
+
+    def copy(self):
+        return listing(self)
+
+    def __getitem__(self, key):
+        if key in LISTING_SLOTS:
+            value = getattr(self, key, UNSET)
+            if value is not UNSET:
+                return value
+        elif self.extras is not None and key in self.extras:
+            return self.extras[key]
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        if key in LISTING_SLOTS:
+            setattr(self, key, value)
+        else:
+            if self.extras is None:
+                self.extras = {}
+            self.extras[key] = value
+
+    def __delitem__(self, key):
+        if key in LISTING_SLOTS:
+            if getattr(self, key, UNSET) is UNSET:
+                raise KeyError(key)
+            delattr(self, key)
+        elif self.extras is not None and key in self.extras:
+            del self.extras[key]
+        else:
+            raise KeyError(key)
+
+    def __contains__(self, key):
+        if key in LISTING_SLOTS:
+            return getattr(self, key, UNSET) is not UNSET
+        return self.extras is not None and key in self.extras
+
+    def get(self, key, default=None):
+        if key in LISTING_SLOTS:
+            value = getattr(self, key, UNSET)
+            return default if value is UNSET else value
+        if self.extras is not None:
+            return self.extras.get(key, default)
+        return default
+
+    def __iter__(self):
+        for field in LISTING_FIELDS:
+            if getattr(self, field, UNSET) is not UNSET:
+                yield field
+        if self.extras:
+            yield from self.extras
+
+    def __len__(self):
+        return sum(1 for field in LISTING_FIELDS if getattr(self, field, UNSET) is not UNSET) + len(self.extras or ())
+
+    def __repr__(self):
+        return f"listing({self.to_json()!r})"
+
+def json_default(value):
+    # json.dump hook so lists of listings are written without building dict copies first
+    if isinstance(value, listing):
+        return value.to_json()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+# Same factor the map page used to turn pcm into pw
+WEEKS_PER_MONTH = 4.34524
+REGEX_PRICE_AMOUNT = re.compile(r'[0-9][0-9,]*(?:\.[0-9]+)?')
+REGEX_PRICE_PERIOD = re.compile(r'(?P<week>pppw|ppw|pw\b|p/w|per week|/ ?week|weekly)|(?P<month>pcm|pm\b|p/m|per month|/ ?month|monthly)|(?P<year>pa\b|p/a|per annum|per year|/ ?year|annually)')
+REGEX_COUNT = re.compile(r'[0-9]+')
+REGEX_ISO_DATE = re.compile(r'^[0-9]{4}-[0-9]{2}-[0-9]{2}$')
+
+def normalise_price(raw):
+    # Weekly price as listed (per person when the agent quotes pppw), None if it can't be read
+    raw = str(raw).lower()
+    amount = REGEX_PRICE_AMOUNT.search(raw)
+    period = REGEX_PRICE_PERIOD.search(raw)
+    if amount is None or period is None:
+        return None
+    price = float(amount.group(0).replace(',', ''))
+    if period.group('month'):
+        price /= WEEKS_PER_MONTH
+    elif period.group('year'):
+        price /= 52
+    return round(price, 2)
+
+def normalise_count(raw):
+    if isinstance(raw, int):
+        return raw
+    if isinstance(raw, list):
+        raw = "".join(str(part) for part in raw)
+    count = REGEX_COUNT.search(str(raw))
+    return int(count.group(0)) if count else None
+
+def normalise_coordinate(raw):
+    try:
+        return float(raw)
+    except (TypeError, ValueError):
+        return None
+
+def normalise_date(raw):
+    if not isinstance(raw, str):
+        return "Unknown"
+    if REGEX_ISO_DATE.match(raw):
+        return raw
+    return extract_available_date("available " + raw)
+
+def normalise_property(property):
+    # Typed fields sit next to the raw strings so the map can filter with plain comparisons
+    property['price_pw'] = normalise_price(property.get('price'))
+    property['beds_count'] = normalise_count(property.get('beds'))
+    property['baths_count'] = normalise_count(property.get('baths'))
+    for field in ('lat', 'lon'):
+        coordinate = normalise_coordinate(property.get(field))
+        if coordinate is not None:
+            property[field] = coordinate
+    property['available_date'] = normalise_date(property.get('available_date'))
     return property
 
-class house_hunt():
+def normalise_stage(properties):
+    for property in properties:
+        normalise_property(property)
+    return properties
+
+REGEX_UNIT = re.compile(r'\b(flat|apartment|apt|studio|bed-?sit|room|rm|unit)\.?\s*(?:no\.?\s*)?([0-9]+[a-z]?)\b')
+UNIT_KINDS = {"apartment": "flat", "apt": "flat", "bed-sit": "bedsit", "rm": "room"}
+
+def dedup_unit(property):
+    # The unit can be in either the title or the address ("Studio 11" / "189 Harborne Lane")
+    for text in (property.get('title'), property.get('address')):
+        if known(text):
+            unit = REGEX_UNIT.search(text.lower())
+            if unit:
+                return (UNIT_KINDS.get(unit.group(1), unit.group(1)), unit.group(2))
+    return None
+
+def dedup_key(property):
+    # (house number, street, unit) from the title, falling back to the address. Listings
+    # without a house number (whole blocks, rooms in halls) are never merged.
+    for text in (property.get('title'), property.get('address')):
+        if not known(text):
+            continue
+        postcode, number, street = parse_location(text)
+        if number and street:
+            return (number, street, dedup_unit(property))
+    return None
+
+def dedup_stage(properties, radius=DEDUP_RADIUS):
+    # Grid cells are one radius wide, so any match lies in the same or a neighbouring cell
+    # and each property is compared against a handful of candidates, not every other one
+    lat_step = radius / 111320
+    lon_step = radius / (111320 * math.cos(math.radians((SELLY_OAK_BOUNDS[0] + SELLY_OAK_BOUNDS[2]) / 2)))
+    cells = {}
+    unplaced = {}
+    canonical = []
+    merged = 0
+
+    for property in properties:
+        property['sources'] = [{"source": property.get('source'), "url": property.get('url'), "price": property.get('price')}]
+        key = dedup_key(property)
+        lat, lon = normalise_coordinate(property.get('lat')), normalise_coordinate(property.get('lon'))
+        match = None
+
+        if key is not None and lat is not None and lon is not None:
+            row, column = int(math.floor(lat / lat_step)), int(math.floor(lon / lon_step))
+            for cell in ((row + i, column + j) for i in (-1, 0, 1) for j in (-1, 0, 1)):
+                for candidate in cells.get((cell, key), ()):
+                    if property.get('source') not in {entry["source"] for entry in candidate['sources']} and distance(lat, lon, candidate['lat'], candidate['lon']) <= radius:
+                        match = candidate
+                        break
+                if match is not None:
+                    break
+            if match is None:
+                cells.setdefault(((row, column), key), []).append(property)
+        elif key is not None:
+            # No coordinates: only an identical address key from another agent counts
+            for candidate in unplaced.get(key, ()):
+                if property.get('source') not in {entry["source"] for entry in candidate['sources']}:
+                    match = candidate
+                    break
+            if match is None:
+                unplaced.setdefault(key, []).append(property)
+
+        if match is None:
+            canonical.append(property)
+            continue
+
+        # The first agent's record wins; the duplicate only fills fields it is missing
+        merged += 1
+        match['sources'].extend(property['sources'])
+        for field, value in property.items():
+            if field != 'sources' and not known(match.get(field)) and known(value):
+                match[field] = value
+
+    log(f"[DEDUP] Merged {merged} duplicate listings into {len(canonical)} properties", "INFO")
+    return canonical
+
+class ndjson_writer():
+    # Appends one compact JSON line per property the moment it is produced. Lines go to a
+    # .part file that is only renamed into place when the agent finishes, so an interrupted
+    # run leaves its progress behind for the next one to resume from.
+    def __init__(self, path) -> None:
+        self.path = path
+        self.part = path + '.part'
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.file = open(self.part, 'w')
+        self.count = 0
+
+    def write(self, property):
+        self.file.write(json.dumps(property, separators=(',', ':'), default=json_default) + '\n')
+        self.file.flush()
+        self.count += 1
+
+    def close(self, complete=True):
+        if self.file.closed:
+            return
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.file.close()
+        if complete:
+            os.replace(self.part, self.path)
+
+def read_ndjson(path):
+    try:
+        with open(path, 'r') as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    yield listing.from_json(json.loads(line))
+                except ValueError:
+                    # A crash can leave the last line half written
+                    log(f"[OUTPUT] Stopping at a truncated line in {path}", "INFO")
+                    return
+    except OSError:
+        return
+
+def write_combined(properties, path=COMBINED_PATH):
+    # Compact consolidation, renamed into place so readers never see a half-written file
+    with open(path + '.tmp', 'w') as f:
+        json.dump(properties, f, sort_keys=True, separators=(',', ':'), default=json_default)
+    os.replace(path + '.tmp', path)
+
+def write_compressed(path, data):
+    # Plain, gzip and (when the brotli package is installed) brotli variants of the same bytes
+    variants = [(path, data), (path + '.gz', gzip.compress(data, 9))]
+    if brotli is not None:
+        variants.append((path + '.br', brotli.compress(data)))
+    for variant, content in variants:
+        with open(variant + '.tmp', 'wb') as f:
+            f.write(content)
+        os.replace(variant + '.tmp', variant)
+
+def map_day(value):
+    # ISO date as a yyyymmdd integer so the map compares dates numerically
+    date = normalise_date(value)
+    return int(date.replace('-', '')) if date != "Unknown" else None
+
+def map_tile(lat, lon, zoom=MAP_TILE_ZOOM):
+    # Slippy-map tile containing the point, the same scheme Leaflet uses
+    scale = 2 ** zoom
+    x = int((lon + 180) / 360 * scale)
+    y = int((1 - math.log(math.tan(math.radians(lat)) + 1 / math.cos(math.radians(lat))) / math.pi) / 2 * scale)
+    return x, y
+
+def span(values):
+    values = [value for value in values if value is not None]
+    return [min(values), max(values)] if values else None
+
+def write_map_bundle(properties, directory=MAP_DATA_DIR, zoom=MAP_TILE_ZOOM):
+    # map.json holds one array per filter column, with sources and statuses interned into
+    # string tables; titles, links and images go to map-<agent>.json, fetched on demand.
+    # Rows are ordered by tile so each tile in the index is a contiguous [start, start+count)
+    # range, summarised with min/max so the map can skip tiles that fail a filter outright.
+    strings = {"source": [], "status": []}
+    interned = {"source": {}, "status": {}}
+    columns = {column: [] for column in ('lat', 'lon', 'price_pw', 'beds', 'baths', 'available', 'status', 'source', 'also')}
+    shards = {}
+
+    def intern(table, value):
+        if value not in interned[table]:
+            interned[table][value] = len(strings[table])
+            strings[table].append(value)
+        return interned[table][value]
+
+    placed = []
+    for property in properties:
+        lat, lon = normalise_coordinate(property.get('lat')), normalise_coordinate(property.get('lon'))
+        if lat is not None and lon is not None:
+            placed.append((map_tile(lat, lon, zoom), lat, lon, property))
+    placed.sort(key=lambda row: row[0])
+
+    tiles = {}
+    for tile, lat, lon, property in placed:
+        key = f"{tile[0]},{tile[1]}"
+        if key not in tiles:
+            tiles[key] = {"start": len(columns["lat"]), "count": 0}
+        tiles[key]["count"] += 1
+        source = property.get('source') or "Unknown"
+        also = [intern("source", entry["source"]) for entry in (property.get('sources') or [])[1:]]
+
+        columns["lat"].append(round(lat, 6))
+        columns["lon"].append(round(lon, 6))
+        columns["price_pw"].append(property.get('price_pw'))
+        columns["beds"].append(property.get('beds_count'))
+        columns["baths"].append(property.get('baths_count'))
+        columns["available"].append(map_day(property.get('available_date')))
+        columns["status"].append(intern("status", property.get('status') or "Unknown"))
+        columns["source"].append(intern("source", source))
+        columns["also"].append(also or None)
+        shards.setdefault(source, []).append({field: property[field] for field in MAP_DETAIL_FIELDS if field in property})
+
+    for tile in tiles.values():
+        rows = range(tile["start"], tile["start"] + tile["count"])
+        prices = [columns["price_pw"][row] for row in rows]
+        tile["price"] = span(prices)
+        tile["price_unknown"] = None in prices
+        tile["beds"] = span(columns["beds"][row] for row in rows)
+        tile["baths"] = span(columns["baths"][row] for row in rows)
+        tile["available"] = span(columns["available"][row] for row in rows)
+
+    names = {source: "map-" + re.sub(r'[^a-z0-9]+', '-', source.lower()).strip('-') + ".json" for source in shards}
+    bundle = {"version": 2, "total": len(properties), "count": len(columns["lat"]), "strings": strings, "columns": columns, "shards": names, "tiles": {"zoom": zoom, "index": tiles}}
+
+    os.makedirs(directory, exist_ok=True)
+    write_compressed(os.path.join(directory, "map.json"), json.dumps(bundle, separators=(',', ':')).encode())
+    for source, records in shards.items():
+        write_compressed(os.path.join(directory, names[source]), json.dumps(records, separators=(',', ':'), default=json_default).encode())
+
+    # Shards of agents that produced nothing this run would otherwise be served stale
+    current = set(names.values())
+    for name in os.listdir(directory):
+        if name.startswith("map-") and name.split('.json')[0] + '.json' not in current:
+            os.remove(os.path.join(directory, name))
+    return bundle
+
+def load_snapshot(path=PREVIOUS_SNAPSHOT):
+    # Previous combined.json indexed as {source: {url: property}}
+    snapshot = {}
+    try:
+        with open(path, 'r') as f:
+            properties = json.load(f)
+    except (OSError, ValueError):
+        log(f"[INCREMENTAL] No usable snapshot at {path}, running a full scrape", "INFO")
+        return snapshot
 
-    def __init__(self) -> None:
+    for property in properties:
+        if 'url' in property:
+            snapshot.setdefault(property.get('source'), {})[property['url']] = listing.from_json(property)
+    return snapshot
+
+class agent_cancelled(Exception):
+    pass
+
+# Every agent subclass registers itself here by class name, in definition order
+AGENTS = {}
+
+class agent():
+    # Construction is side-effect free; page one is fetched by discover() on first use
+    # and kept so the listing stage can parse it without downloading it again
+    SOURCE = None
+    # Listing fields compared against the snapshot to decide whether a card changed
+    CHANGE_FIELDS = ('price', 'status', 'title')
+    # Lower priorities start first when there are fewer workers than agents
+    PRIORITY = 100
+    DEADLINE = AGENT_DEADLINE
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        AGENTS[cls.__name__] = cls
+
+    def __init__(self, client=None) -> None:
+        self.client = client or default_client()
         self.properties = []
+        self.pages = None
+        self.probe = None
+
+        self.status = "pending"
+        self.started = None
+        self.cancelled = threading.Event()
+        self.cancelled_at = None
+
+        self.previous = {}
+        self.changes = {"new": 0, "changed": 0, "unchanged": 0}
+        self.changes_lock = threading.Lock()
+        self.writer = None
+
+    def use_snapshot(self, snapshot):
+        self.previous = snapshot.get(self.SOURCE, {})
+
+    def open_output(self, directory=OUTPUT_DIR):
+        # Properties left by an interrupted run are fresher than the snapshot, so they are
+        # carried over like unchanged cards instead of being fetched again
+        path = os.path.join(directory, f"{type(self).__name__}.ndjson")
+        resumed = {property['url']: property for property in read_ndjson(path + '.part') if 'url' in property}
+        if resumed:
+            log(f"[OUTPUT] Resuming {type(self).__name__} with {len(resumed)} properties from an interrupted run", "INFO")
+            self.previous = {**self.previous, **resumed}
+        self.writer = ndjson_writer(path)
+
+    def close_output(self, complete=True):
+        if self.writer is not None:
+            self.writer.close(complete)
 
-        self.BASE_LINK = "https://www.househuntltd.co.uk/properties/lettings"
+    def find_first(self):
+        raise NotImplementedError
 
-        soup = BeautifulSoup(get(self.BASE_LINK).text, features="lxml")
+    def find_all(self):
+        raise NotImplementedError
 
-        page_info = findall(r'[0-9]', soup.find('span', class_='page-number').text)
-        self.pages = page_info[1]
+    def cancel(self):
+        # Cooperative: the agent stops at its next page, detail fetch or collected property
+        self.cancelled_at = time.time()
+        self.cancelled.set()
 
-    def find_first(self):
-        self.get_page_info(self.BASE_LINK)
+    def check_cancelled(self):
+        if self.cancelled.is_set():
+            raise agent_cancelled(f"{type(self).__name__} was cancelled")
 
-        new_properties = []
-        for property in self.properties:
-            log(f"[HOUSE HUNT] Getting more data about... {property['title']}")
-            property = self.get_property_info(property['url'], property)
+    def collect(self, properties):
+        name = type(self).__name__
+        for property in properties:
+            self.check_cancelled()
+            self.properties.append(property)
+            METRICS.inc("agent_records_total", agent=name)
+            if self.writer is not None:
+                self.writer.write(property)
+
+    def enrich(self, property, index, total):
+        # Incremental mode: unchanged cards carry over the previous record and skip the detail fetch
+        previous = self.previous.get(property.get('url'))
+        if previous is None:
+            change = "new"
+        elif [field for field in self.CHANGE_FIELDS if field in property and previous.get(field) != property[field]]:
+            change = "changed"
+        else:
+            change = "unchanged"
+
+        with self.changes_lock:
+            self.changes[change] += 1
+
+        if change == "unchanged":
+            # Previous values win so carried records match what the detail stage produced
+            property.update(previous)
+            return property
+        return self.detail(property, index, total)
+
+    def removed(self):
+        current = {property.get('url') for property in self.properties}
+        return [url for url in self.previous if url not in current]
+
+    def first_page_url(self):
+        return self.BASE_LINK
+
+    def parse_response(self, resp):
+        return parse_html(resp.content, resp.encoding or resp.apparent_encoding)
+
+    def count_pages(self, page):
+        raise NotImplementedError
+
+    def fetch(self, url, kind, **kwargs):
+        # Every agent request goes through here so request counts, bytes and latency are per agent
+        name = type(self).__name__
+        start = time.perf_counter()
+        resp = self.client.get(url, **kwargs)
+        METRICS.observe("agent_request_seconds", time.perf_counter() - start, agent=name, kind=kind)
+        METRICS.inc("agent_requests_total", agent=name, kind=kind, cached="true" if getattr(resp, 'from_cache', False) else "false")
+        METRICS.inc("agent_response_bytes_total", len(resp.content), agent=name, kind=kind)
+        return resp
+
+    def parse_listing(self, resp):
+        start = time.perf_counter()
+        page = self.parse_response(resp)
+        METRICS.observe("agent_parse_seconds", time.perf_counter() - start, agent=type(self).__name__, kind="listing")
+        return page
+
+    def discover(self):
+        if self.pages is None:
+            self.check_cancelled()
+            url = self.first_page_url()
+            page = self.parse_listing(self.fetch(url, "listing"))
+            self.pages = self.count_pages(page)
+            self.probe = (url, page)
+        return self.pages
+
+    def fetch_page(self, url):
+        if self.probe is not None and self.probe[0] == url:
+            page = self.probe[1]
+            self.probe = None
+            return page
+        self.check_cancelled()
+        return self.parse_listing(self.fetch(url, "listing"))
+
+    def parse_detail(self, resp, property, parse):
+        start = time.perf_counter()
+        pool = parse_pool()
+        if pool is None:
+            property = parse(self.parse_response(resp), property)
+        else:
+            encoding = resp.encoding or resp.apparent_encoding
+            property = pool.submit(parse_remote, type(self).__name__, parse.__name__, resp.content, encoding, property).result()
+        METRICS.observe("agent_parse_seconds", time.perf_counter() - start, agent=type(self).__name__, kind="detail")
+        return property
 
-            new_properties.append(property)
-        self.properties = new_properties
+    def fetch_detail(self, url, property, parse):
+        # Unchanged detail pages reuse the fields parse() extracted last time instead of re-parsing
+        self.check_cancelled()
+        resp = self.fetch(url, "detail", cache=True)
+        if not getattr(resp, 'digest', None):
+            return self.parse_detail(resp, property, parse)
+
+        before = dict(property)
+        key = hashlib.sha256(f"{DETAIL_CACHE_VERSION}:{resp.digest}:{json.dumps(before, sort_keys=True, default=str)}".encode()).hexdigest()
+        fields = self.client.cache.fields(url, key)
+        if fields is not None:
+            if LOG_DEBUG:
+                log(f"[HTTP CACHE] Unchanged, reusing details for {property['title']}")
+            METRICS.inc("agent_detail_reused_total", agent=type(self).__name__)
+            property.update(fields)
+            return property
+
+        property = self.parse_detail(resp, property, parse)
+        self.client.cache.store_fields(url, key, {k: v for k, v in property.items() if k not in before or before[k] != v})
+        return property
+
+class house_hunt(agent):
+    SOURCE = "House Hunt"
+    PRIORITY = 20
+    DETAIL_WORKERS = DETAIL_WORKERS
+
+    XPATH_PAGE_NUMBER = xpath("//span[has-class('page-number')]")
+    XPATH_TABLE = xpath("//div[has-class('properties')]")
+    XPATH_CARDS = xpath(".//div[has-class('grid')]")
+    XPATH_TITLE_LINK = xpath("(.//span[has-class('title')])[1]//a")
+    XPATH_PRICE = xpath(".//span[has-class('price')]")
+    XPATH_SIZE = xpath(".//span[has-class('property-size')]")
+    XPATH_CONTENT = xpath("//div[@id='content']")
+    XPATH_ALERT_ERROR = xpath(".//div[class-is('grid alert alert-error')]")
+    XPATH_ALERT_SUCCESS = xpath(".//div[class-is('grid alert alert-success')]")
+    XPATH_SLIDES = xpath("(//div[has-class('flexslider')])[1]//img")
+    XPATH_FLEXSLIDER = xpath("//div[has-class('flexslider')]")
+
+    def __init__(self, client=None) -> None:
+        super().__init__(client)
+
+        self.BASE_LINK = "https://www.househuntltd.co.uk/properties/lettings"
+
+    def count_pages(self, soup):
+        page_info = findall(r'[0-9]', text(self.XPATH_PAGE_NUMBER(soup)[0]))
+        return page_info[1]
+
+    def find_first(self):
+        self.collect(stream_details([self.BASE_LINK], self.get_page_info, self.enrich, self.DETAIL_WORKERS))
 
-        
     def find_all(self):
-        urls = []
+        self.discover()
+
+        urls = [self.BASE_LINK]
         for i in range(1, int(self.pages)):
             urls.append(self.BASE_LINK + f'?start={i * 60}')
 
-        self.get_page_info(self.BASE_LINK)
-        for url in urls:
-            self.get_page_info(url)
+        self.collect(stream_details(urls, self.get_page_info, self.enrich, self.DETAIL_WORKERS))
 
-
-        new_properties = []
-        for index, property in enumerate(self.properties):
-            property = self.get_property_info(property['url'], property, index, len(self.properties))
-
-            new_properties.append(property)
-        self.properties = new_properties
+    def detail(self, property, index, total):
+        return self.get_property_info(property['url'], property, index, total)
 
 
     def get_page_info(self, url):
         properties = []
 
-        soup = BeautifulSoup(get(url).text, features="lxml")
+        soup = self.fetch_page(url)
 
-        table = soup.find_all('div', class_='properties')
-        page_properties = table[0].find_all('div', class_='grid')
+        table = self.XPATH_TABLE(soup)
+        page_properties = self.XPATH_CARDS(table[0])
         for property in page_properties:
-            x = {}
-            x_span = property.find('span', class_='title')
-            x['title'] = x_span.find('a').text.split(',')[0]
+            x = listing()
+            x_link = self.XPATH_TITLE_LINK(property)[0]
+            x['title'] = text(x_link).split(',')[0]
 
-            log(f"[HOUSE HUNT] Getting basic data about... {x['title']}")
+            if LOG_DEBUG:
+                log(f"[HOUSE HUNT] Getting basic data about... {x['title']}")
 
-            x['source'] = "House Hunt"            
-            x['address'] = x_span.find('a').text
-            x['url'] = "https://www.househuntltd.co.uk" + x_span.find('a')['href']
-            x['price'] = property.find('span', class_='price').text
+            x['source'] = self.SOURCE
+            x['address'] = text(x_link)
+            x['url'] = "https://www.househuntltd.co.uk" + x_link.attrib['href']
+            x['price'] = text(self.XPATH_PRICE(property)[0])
             
-            x_property_size = property.find('span', class_='property-size')
-            x_property_size = findall(r'[0-9]', x_property_size.text)
+            x_property_size = self.XPATH_SIZE(property)[0]
+            x_property_size = findall(r'[0-9]+', text(x_property_size))
 
 
             # TODO FIX THIS, 115 Tiv.
             if len(x_property_size) == 2:
                 x['beds'] = x_property_size[0]
                 x['baths'] = x_property_size[1]
-            elif len(x_property_size) == 3:
-                x['beds'] = x_property_size[0:1]
-                x['baths'] = x_property_size[2]
-            elif len(x_property_size) == 4:
-                x['beds'] = x_property_size[0:1]
-                x['baths'] = x_property_size[2:3]
             # x['beds'] = x_property_size.text.split(' ')[0]
 
             properties.append(x)
-        self.properties = self.properties + properties
+        return properties
 
     def get_property_info(self, url, property, index=0, total=0):
-        log(f"[HOUSE HUNT] [{index}/{total}] Getting more data about... {property['title']}")
-        soup = BeautifulSoup(get(url).text, features="lxml")
+        if LOG_DEBUG:
+            log(f"[HOUSE HUNT] [{index}/{total}] Getting more data about... {property['title']}")
+        return self.fetch_detail(url, property, self.parse_property_info)
 
-        content = soup.find_all('div', id='content')[0]
-        available_date = content.find_all('div', class_="grid alert alert-error")
+    def parse_property_info(self, soup, property):
+        content = self.XPATH_CONTENT(soup)[0]
+        available_date = self.XPATH_ALERT_ERROR(content)
         if len(available_date) < 1:
-            available_date = content.find_all('div', class_="grid alert alert-success")
+            available_date = self.XPATH_ALERT_SUCCESS(content)
         if len(available_date) < 1:
             property['available_date'] = "Unknown"
         else:
-            property['available_date'] = available_date[0].text.split(':')[1].strip()
+            property['available_date'] = extract_available_date(text(available_date[0]))
 
         try:
-            slides = soup.find('div', class_='flexslider').find_all('img')
+            if not self.XPATH_FLEXSLIDER(soup):
+                raise ValueError("No flexslider")
+            slides = self.XPATH_SLIDES(soup)
 
             if len(slides) > 0:
                 property['images'] = []
 
                 for img in slides:
-                    if img['src']:
-                        if 'media' in img['src']:
-                            property['images'].append("https://www.househuntltd.co.uk" + img['src'])
+                    if img.attrib['src']:
+                        if 'media' in img.attrib['src']:
+                            property['images'].append("https://www.househuntltd.co.uk" + img.attrib['src'])
         except:
-            log(f"ERROR - Could not find images for {property['title']}")
+            log(f"Could not find images for {property['title']}", "ERROR")
         
         # property = geocode_property(property)
 
         return property
-    def save_to_json(self):
-        log(f"House Hunt - Saving to JSON")
-        with open('house_hunt.json', 'w') as f:
-            json.dump(self.properties, f, sort_keys=True, indent=4)
-    
-class easy_lettings():
 
-    def __init__(self) -> None:
+class easy_lettings(agent):
+    SOURCE = "Easy Lettings"
+    PRIORITY = 30
+    DETAIL_WORKERS = DETAIL_WORKERS
+
+    XPATH_PAGE_BUTTONS = xpath("(//ul[has-class('page-numbers')])[1]//li")
+    XPATH_CARDS = xpath("(//ul[has-class('property_ul')])[1]//li")
+    XPATH_LINK = xpath("(.//div[has-class('link-holder')])[1]//a")
+    XPATH_TITLE = xpath("(.//div[has-class('address_holder')])[1]//h5")
+    XPATH_PRICE = xpath(".//div[has-class('price')]")
+    XPATH_ICONS = xpath(".//div[has-class('icons-holder')]")
+    XPATH_SOLD = xpath(".//div[has-class('sold_text')]")
+    XPATH_ICON_TITLE = xpath(".//div[has-class('property_icon_title')]")
+    XPATH_ICON_VALUE = xpath(".//div[has-class('property_icons')]")
+    XPATH_CONTENT = xpath("//div[has-class('content_holder')]")
+    XPATH_IMAGES = xpath("//img[has-class('owl-img')]")
+
+    def __init__(self, client=None) -> None:
+        super().__init__(client)
         self.BASE_LINK = "https://easylettingsbirmingham.co.uk/property-list/?department=residential-lettings&marketing_flag=67&marketing_flag_id=67"
-        self.properties = []
-
-        soup = BeautifulSoup(get(self.BASE_LINK).text, features="lxml")
 
-        page_buttons = soup.find('ul', class_='page-numbers').find_all('li')
+    def count_pages(self, soup):
+        page_buttons = self.XPATH_PAGE_BUTTONS(soup)
 
-        self.pages = page_buttons[-2].text
+        return text(page_buttons[-2])
     
     def find_first(self):
-        self.get_page_info(self.BASE_LINK)
-
-        new_properties = []
-        for property in self.properties:
-            new_properties.append(self.get_property_info(property['url'], property))
-        self.properties = new_properties
+        self.collect(stream_details([self.BASE_LINK], self.get_page_info, self.enrich, self.DETAIL_WORKERS))
 
     def find_all(self):
-        for i in range(1, int(self.pages) + 1):
+        self.discover()
+
+        # Page one is the probe already parsed by discover()
+        urls = [self.BASE_LINK]
+        for i in range(2, int(self.pages) + 1):
         # for i in range(1, 2):
-            self.get_page_info(f"https://easylettingsbirmingham.co.uk/property-list/page/{i}/?department=residential-lettings&marketing_flag=67&marketing_flag_id=67")
-        
-        counter = 0
-        new_properties = []
-        for property in self.properties:
-            counter += 1
-            log(f"[EASY LETTINGS] [{counter} / {len(self.properties)}] Getting more data about... {property['title']}")
-            new_properties.append(self.get_property_info(property['url'], property))
-        self.properties = new_properties
+            urls.append(f"https://easylettingsbirmingham.co.uk/property-list/page/{i}/?department=residential-lettings&marketing_flag=67&marketing_flag_id=67")
+
+        self.collect(stream_details(urls, self.get_page_info, self.enrich, self.DETAIL_WORKERS))
+
+    def detail(self, property, index, total):
+        if LOG_DEBUG:
+            log(f"[EASY LETTINGS] [{index + 1} / {total}] Getting more data about... {property['title']}")
+        return self.get_property_info(property['url'], property)
 
     def get_page_info(self, url):
-        log(f"[EASY LETTINGS] Getting page info from... {url}")
+        if LOG_DEBUG:
+            log(f"[EASY LETTINGS] Getting page info from... {url}")
+        properties = []
 
-        soup = BeautifulSoup(get(url).text, features="lxml")
-        property_list = soup.find('ul', class_='property_ul')
-        properties_raw = property_list.find_all('li')
+        soup = self.fetch_page(url)
+        properties_raw = self.XPATH_CARDS(soup)
 
         for property_raw in properties_raw:
-            property = {}
+            property = listing()
 
-            property['source'] = "Easy Lettings"
-            property['url'] = property_raw.find('div', class_="link-holder").find('a')['href']
-            property['title'] = property_raw.find('div', class_="address_holder").find('h5').text
-            log(f"[EASY LETTINGS] Getting basic data about... {property['title']}")
+            property['source'] = self.SOURCE
+            property['url'] = self.XPATH_LINK(property_raw)[0].attrib['href']
+            property['title'] = text(self.XPATH_TITLE(property_raw)[0])
+            if LOG_DEBUG:
+                log(f"[EASY LETTINGS] Getting basic data about... {property['title']}")
             # property['title'] = property_raw.find('h3').text
             # property['address'] = property_raw.find('p', class_='address').textz
-            raw_price = property_raw.find('div', class_='price').text.strip().split('£')
+            raw_price = text(self.XPATH_PRICE(property_raw)[0]).strip().split('£')
             try:
                 property['price'] = f"£{raw_price[1]} {raw_price[0]}"
             except:
@@ -255,180 +2022,146 @@ class easy_lettings():
             #         except:
             #             pass
             
-            if 'lat' not in property:
-                log(f"{COLOURS['FAIL']}ERROR{COLOURS['ENDC']} - Could not find lat/long for {property['title']}")
-
-            icon_data = property_raw.find_all('div', {'class': 'icons-holder'})
+            icon_data = self.XPATH_ICONS(property_raw)
 
-            if property_raw.find('div', class_='sold_text'):
-                if property_raw.find('div', class_='sold_text').text == "Let":
+            sold = self.XPATH_SOLD(property_raw)
+            if sold:
+                if text(sold[0]) == "Let":
                     property['status'] = "Let"
             else:
                 property['status'] = "Unknown"
 
             for icon_datum in icon_data:
-                if icon_datum.find('div', class_='property_icon_title').text == "Bedrooms":
-                    property['beds'] = icon_datum.find('div', class_="property_icons").text.strip()
-                elif icon_datum.find('div', class_='property_icon_title').text == "Bathrooms":
-                    property['baths'] = icon_datum.find('div', class_="property_icons").text.strip()
-            self.properties.append(property)
+                icon_title = text(self.XPATH_ICON_TITLE(icon_datum)[0])
+                if icon_title == "Bedrooms":
+                    property['beds'] = text(self.XPATH_ICON_VALUE(icon_datum)[0]).strip()
+                elif icon_title == "Bathrooms":
+                    property['baths'] = text(self.XPATH_ICON_VALUE(icon_datum)[0]).strip()
+            properties.append(property)
+        return properties
 
     def get_property_info(self, url, property):
-        soup = BeautifulSoup(get(url).text, features="lxml")
-
-        for script in soup.find_all('script'):
-            try:
-                raw_lat_long = script.text.split('L.marker([')[1].split('])')[0].split(',')
-                property['lat'] = raw_lat_long[0].strip()
-                property['lon'] = raw_lat_long[1].strip()
-                # log(f"{property['lat']}, {property['lon']}")
-            except:
-                # log(f"ERROR - Could not find lat/long for {property['title']} via L.marker")
-                try:
-                    raw_lat_long =  script.text.split('setView([')[1].split('],')[0].split(',')
-                    property['lat'] = raw_lat_long[0].strip()
-                    property['lon'] = raw_lat_long[1].strip()
-                    # log(f"{property['lat']}, {property['lon']}")
-                except:
-                    # log(f"ERROR - Could not find lat/long for {property['title']} via setView")
-                    pass
+        return self.fetch_detail(url, property, self.parse_property_info)
+
+    def parse_property_info(self, soup, property):
+        for script in XPATH_SCRIPTS(soup):
+            script = script_text(script)
+            marker = REGEX_LEAFLET_MARKER.search(script)
+            if marker and split_coordinates(property, marker.group(1), ','):
+                continue
+            view = REGEX_LEAFLET_VIEW.search(script)
+            if view:
+                split_coordinates(property, view.group(1), ',')
 
         if ('lat' not in property) or ('lon' not in property):
-            log(f"ERROR - Could not find lat/long for {property['title']}")
+            log(f"Could not find lat/long for {property['title']}", "ERROR")
             # property = geocode_property(property)
         else:
-            log(f"Found lat/long for {property['title']}: {property['lat']}, {property['lon']}")
-
-
-        div_content_text = soup.find('div', class_='content_holder').text
-
-        div_content_text_line_by_line = div_content_text.split('\n')
-
-        property['available_date'] = "Unknown"
-
-        for line in div_content_text_line_by_line:
-            line = line.lower()
+            if LOG_DEBUG:
+                log(f"Found lat/long for {property['title']}: {property['lat']}, {property['lon']}")
 
-            if "available now" in line:
-                property['available_date'] = DATE_TODAY
 
-            elif "available from: " in line:
-                raw_date = line.split('available from:')[1].strip()
-                # log(f"Found available date... {raw_date} about {property['title']}")
+        div_content_text = text(self.XPATH_CONTENT(soup)[0])
 
-                if match(REGEX_DATE, raw_date):
-                    property['available_date'] = raw_date
-                elif ' ' in raw_date:
-                    property['available_date'] = raw_date.split(' ')[0]
-
-            elif "available: " in line:
-                raw_date = line.split('available:')[1].strip()
-                # log(f"Found available date... {raw_date} about {property['title']}")
-
-                if match(REGEX_DATE, raw_date):
-                    property['available_date'] = raw_date
-                elif ' ' in raw_date:
-                    property['available_date'] = raw_date.split(' ')[0]
-            
-            elif "available " in line:
-                raw_date = line.split('available ')[1].strip()
-                # log(f"Found available date... {raw_date} about {property['title']}")
-
-                if match(REGEX_DATE, raw_date):
-                    property['available_date'] = raw_date
-                elif ' ' in raw_date:
-                    raw_date = raw_date.split(' ')[0]
-                    if match(REGEX_DATE, raw_date):
-                        property['available_date'] = raw_date
+        property['available_date'] = extract_available_date(div_content_text)
         if property['available_date'] == "Unknown":
-            log(f"ERROR - Could not find date for {property['title']}")
+            log(f"Could not find date for {property['title']}", "ERROR")
 
-        images = soup.find_all('img', class_='owl-img')
+        images = self.XPATH_IMAGES(soup)
 
         property['images'] = []
 
         if images:
             for img in images:
                 try:
-                    property['images'].append(img.parent['style'].split('url(')[1][:-1].split(')')[0])
+                    property['images'].append(img.getparent().attrib['style'].split('url(')[1][:-1].split(')')[0])
                 except:
-                    log(f"ERROR - Could not find image link {img['alt']} for {property['title']}")
+                    log(f"Could not find image link {img.attrib['alt']} for {property['title']}", "ERROR")
         else:
-            log(f"ERROR - Could not find images for {property['title']}")
+            log(f"Could not find images for {property['title']}", "ERROR")
             
 
         return property
-    def save_to_json(self):
-        log(f"Easy Lettings - Saving to JSON")
-        with open('easy_lettings.json', 'w') as f:
-            # print(y.properties)
-            json.dump(self.properties, f, sort_keys=True, indent=4)
-
-class oakmans():
-    def __init__(self) -> None:
+
+class oakmans(agent):
+    SOURCE = "Oakmans"
+    PRIORITY = 40
+    DETAIL_WORKERS = DETAIL_WORKERS
+
+    XPATH_PAGINATION = xpath("(//ul[has-class('pagination')])[1]//li")
+    XPATH_CARDS = xpath("(//div[class-is('properties card-deck')])[1]//a")
+    XPATH_HEADER = xpath(".//h3[has-class('card-header')]")
+    XPATH_SMALL = xpath(".//small")
+    XPATH_TEXT = xpath(".//p[has-class('card-text')]")
+    XPATH_DESCRIPTION = xpath("(//h4[. = 'Description'])[1]")
+    XPATH_NEXT_P = xpath("(descendant::p | following::p)[1]")
+
+    def __init__(self, client=None) -> None:
+        super().__init__(client)
         self.BASE_LINK = f"https://oakmans.co.uk/buying/?department=student"
-        self.properties = []
 
-        soup = BeautifulSoup(get(self.BASE_LINK).text, features="lxml")
+    def count_pages(self, soup):
         try:
-            self.pages = soup.find('ul', class_='pagination').find_all('li')[-2].text
+            return text(self.XPATH_PAGINATION(soup)[-2])
         except:
             raise Exception("Could not find pages for Oakmans")
 
-
     def find_first(self):
-        current_page = 1
-        url = f"https://oakmans.co.uk/buying/page/{current_page}/?department=student"
-
-        self.get_page_info(url)
+        self.collect(stream_details([1], self.get_page_by_number, self.enrich, self.DETAIL_WORKERS))
 
     def find_all(self):
-        for i in range(1, int(self.pages) + 1):
-            url = f"https://oakmans.co.uk/buying/page/{i}/?department=student"
-            self.get_page_info(url, id=i,pages=int(self.pages))
-        
+        self.discover()
+        self.collect(stream_details(range(1, int(self.pages) + 1), self.get_page_by_number, self.enrich, self.DETAIL_WORKERS))
 
-    def save_to_json(self):
-        with open('oakmans.json', 'w') as f:
-            json.dump(self.properties, f, sort_keys=True, indent=4)
+    def detail(self, property, index, total):
+        return self.get_property_info(property['url'], property, id=index, total=total)
+
+    def get_page_by_number(self, page):
+        if page == 1:
+            url = self.BASE_LINK
+        else:
+            url = f"https://oakmans.co.uk/buying/page/{page}/?department=student"
+        return self.get_page_info(url, id=page, pages=int(self.pages or 1))
 
     def get_page_info(self, url, id=0, pages=0):
-        soup = BeautifulSoup(get(url).text, features="lxml")
+        soup = self.fetch_page(url)
 
-        log(f"[OAKMANS] [{id}/{pages}] Oakmans - Getting page info from... {url}")
+        if LOG_DEBUG:
+            log(f"[OAKMANS] [{id}/{pages}] Oakmans - Getting page info from... {url}")
 
-        properties_raw = soup.find('div', class_='properties card-deck')
-        properties_raw = properties_raw.find_all('a')
+        properties_raw = self.XPATH_CARDS(soup)
 
-        for index, property_raw in enumerate(properties_raw):
-            property = {}
+        properties = []
+        for property_raw in properties_raw:
+            property = listing()
 
 
-            property['source'] = "Oakmans"
-            property['url'] = property_raw['href']
-            property['title'] = property_raw.find('h3', class_='card-header').text.split('£')[0].strip()
-            log(f"[OAKMANS] Getting basic data about... {property['title']}")
-            property['price'] = property_raw.find('small').text.strip()
+            property['source'] = self.SOURCE
+            property['url'] = property_raw.attrib['href']
+            property['title'] = text(self.XPATH_HEADER(property_raw)[0]).split('£')[0].strip()
+            if LOG_DEBUG:
+                log(f"[OAKMANS] Getting basic data about... {property['title']}")
+            property['price'] = text(self.XPATH_SMALL(property_raw)[0]).strip()
 
             property['price'] = property['price'].replace('per person per week', 'pppw')
 
-            property['beds'] = property_raw.find('p', class_='card-text').text.split(' ')[0].strip()
+            property['beds'] = text(self.XPATH_TEXT(property_raw)[0]).split(' ')[0].strip()
 
-            property = self.get_property_info(property['url'], property, id=index, total=len(properties_raw))
-
-            self.properties.append(property)
+            properties.append(property)
+        return properties
 
     def get_property_info(self, url, property, id=0, total=0):
-        soup = BeautifulSoup(get(url).text, features="lxml")
+        if LOG_DEBUG:
+            log(f"[OAKMANS] [{id}/{total}] Getting more data about... {property['title']}")
+        return self.fetch_detail(url, property, self.parse_property_info)
 
-        log(f"[OAKMANS] [{id}/{total}] Getting more data about... {property['title']}")
-
-        lat_lng = soup.find_all('script')[-4].text.split('\n')[7].split('LatLng(')[1].split(')')[0].split(',')
-        property['lat'] = lat_lng[0].strip()
-        property['lon'] = lat_lng[1].strip()
+    def parse_property_info(self, soup, property):
+        lat_lng = REGEX_LATLNG.search(script_text(XPATH_SCRIPTS(soup)[-4]).split('\n')[7])
+        if not lat_lng or not split_coordinates(property, lat_lng.group(1), ','):
+            raise ValueError(f"Could not find LatLng for {property['title']}")
 
         property['available_date'] = "Unknown"
-        features = soup.find('h4', text='Description').find_next('p').text
+        features = text(self.XPATH_NEXT_P(self.XPATH_DESCRIPTION(soup)[0])[0])
         features_split = features.split(' – ')
 
         try:
@@ -453,20 +2186,26 @@ class oakmans():
                 else:
                     property['baths'] = 'Unknown'
         except:
-            log(f"ERROR - Could not find baths for {property['title']}")
+            log(f"Could not find baths for {property['title']}", "ERROR")
             property['baths'] = "Unknown"
 
         return property
     
-class purple_frog():
-    def __init__(self) -> None:
+class purple_frog(agent):
+    PRIORITY = 90
+    XPATH_PAGES = xpath("(//ul[has-class('pagination')])[1]//li[has-class('page')]")
+    XPATH_CARDS = xpath("//div[has-class('housing')]")
+    XPATH_LINK = xpath(".//a[class-is('url permalink summary adr')]")
+    XPATH_PRICE = xpath(".//div[class-is('price rent')]")
+    XPATH_FEATURES = xpath("((.//footer[has-class('description')])[1]//ul)[1]//li")
+
+    def __init__(self, client=None) -> None:
+        super().__init__(client)
 
-        self.properties = []
         self.BASE_LINK = "https://www.purplefrogproperty.com/student-accommodation/Birmingham/?bills=&price%5Bfrom%5D=85&price%5Bto%5D=220&doubles%5Bfrom%5D=0&doubles%5Bto%5D=8&showers%5Bfrom%5D=1&showers%5Bto%5D=8&wc%5Bfrom%5D=1&wc%5Bto%5D=8&drawn=&year=next&sort=price-low&features=&view=grid"
-        
-        soup = BeautifulSoup(get(self.BASE_LINK).text, features="lxml")
 
-        self.pages = soup.find('ul', class_='pagination').find_all('li', class_="page")[-3].text
+    def count_pages(self, soup):
+        return text(self.XPATH_PAGES(soup)[-3])
     
     def find_first(self):
         self.get_page_info(self.BASE_LINK)
@@ -474,64 +2213,70 @@ class purple_frog():
     def find_all(self):
         pass
 
-    def save_to_json(self):
-        with open('purple_frog.json', 'w') as f:
-            json.dump(self.properties, f, sort_keys=True, indent=4)
-
     def get_page_info(self, url):
-        soup = BeautifulSoup(get(url).text, features="lxml")
+        soup = self.fetch_page(url)
 
-        properties_raw = soup.find_all('div', class_='housing')
+        properties_raw = self.XPATH_CARDS(soup)
         
         for property_raw in properties_raw:
-            property = {}
+            property = listing()
 
-            property["title"] = property_raw.find('a', class_="url permalink summary adr").text
-            property["url"] = "https://www.purplefrogproperty.com" + property_raw.find('a', class_="url permalink summary adr")['href']
-            property["price"] = property_raw.find('div', class_="price rent").text.strip()
+            link = self.XPATH_LINK(property_raw)[0]
+            property["title"] = text(link)
+            property["url"] = "https://www.purplefrogproperty.com" + link.attrib['href']
+            property["price"] = text(self.XPATH_PRICE(property_raw)[0]).strip()
 
-            property_raw_features = property_raw.find('footer', class_="description").find('ul').find_all('li')
-            property['beds'] = property_raw_features[1].text.split(' ')[0].strip()
+            property_raw_features = self.XPATH_FEATURES(property_raw)
+            property['beds'] = text(property_raw_features[1]).split(' ')[0].strip()
 
             if property['beds'] == "Share":
                 property['beds'] = "Unknown"
 
-            property['baths'] = property_raw_features[2].text.split(' ')[0].strip()
-            log(f"[PURPLE FROG] Getting basic data about... {property['title']}")
+            property['baths'] = text(property_raw_features[2]).split(' ')[0].strip()
+            if LOG_DEBUG:
+                log(f"[PURPLE FROG] Getting basic data about... {property['title']}")
             
-            self.properties.append(property)
+            self.collect([property])
 
 
     def get_property_info(self, url, property):
         pass
 
-class king_co():
-    def __init__(self):
+class king_co(agent):
+    SOURCE = "King & Co"
+    PRIORITY = 80
+
+    def __init__(self, client=None):
+        super().__init__(client)
         self.BASE_LINK = "https://www.kingandcoproperties.com/search.ljson?channel=lettings&fragment=page-1"
-        self.properties = []
 
-        first_page = get(self.BASE_LINK).json()
+    def parse_response(self, resp):
+        return resp.json()
+
+    def count_pages(self, first_page):
         total_properties = first_page['pagination']["total_count"]
 
-        self.pages = int(total_properties / 12) + 1
+        return int(total_properties / 12) + 1
 
     def find_all(self):
+        self.discover()
         for i in range(1, self.pages + 1):
             self.get_page_info(f"https://www.kingandcoproperties.com/search.ljson?channel=lettings&fragment=page-{i}")
     def find_first(self):
         self.get_page_info(self.BASE_LINK)
     
     def get_page_info(self, url):
-        log(f"[KING & CO] Getting page info from... {url}")
+        if LOG_DEBUG:
+            log(f"[KING & CO] Getting page info from... {url}")
 
-        page = get(url).json()
+        page = self.fetch_page(url)
 
         for property in page['properties']:
             property = self.get_property_info(property)
-            self.properties.append(property)
+            self.collect([property])
     
     def get_property_info(self, property_raw):
-        property = {}
+        property = listing()
 
         property["title"] = property_raw['display_address']
         property["url"] = "https://www.kingandcoproperties.com" + property_raw['property_url']
@@ -542,70 +2287,88 @@ class king_co():
         property['beds'] = property_raw['bedrooms']
         property['baths'] = property_raw['bathrooms']
         property['receptions'] = property_raw['reception_rooms']
-        property['source'] = "King & Co"
+        property['source'] = self.SOURCE
 
         return property
-    def save_to_json(self):
-        with open('king_co.json', 'w') as f:
-            json.dump(self.properties, f, sort_keys=True, indent=4)
 
-class direct_housing():
-    def __init__(self):
+class direct_housing(agent):
+    SOURCE = "Direct Housing"
+    PRIORITY = 10
+    # Status is reset by the detail stage, so only the card's price and title are comparable
+    CHANGE_FIELDS = ('price', 'title')
+    DETAIL_WORKERS = DETAIL_WORKERS
+
+    XPATH_PAGINATION = xpath("(//div[has-class('propertyhive-pagination')])[1]//a")
+    XPATH_CARDS = xpath("//div[has-class('details')]")
+    XPATH_TITLE = xpath(".//h3")
+    XPATH_LINK = xpath(".//a")
+    XPATH_PRICE = xpath(".//div[has-class('price')]")
+    XPATH_AVAILABILITY = xpath(".//div[has-class('availability')]")
+    XPATH_BEDROOMS = xpath("//div[has-class('elementor-widget-bedrooms')]")
+    XPATH_BATHROOMS = xpath("//div[has-class('elementor-widget-bathrooms')]")
+    XPATH_PLAIN_SCRIPTS = xpath("//script[not(@class) and not(@id) and not(@type)]")
+
+    def __init__(self, client=None):
+        super().__init__(client)
         self.BASE_LINK = ("https://direct-housing.co.uk/property-search/page/", "/?orderby=price-asc&address_keyword&radius=1&department=residential-lettings&_let_type=Student&property_type&bedrooms&minimum_price&maximum_price&minimum_rent&maximum_rent&commercial_property_type&commercial_for_sale_to_rent&commercial_minimum_price&commercial_maximum_price&commercial_minimum_rent&commercial_maximum_rent&lat&lng")
-        self.properties = []
-        
-        self.pages = self.max_pages()
-        log(f"[DIRECT HOUSING] Found {self.pages} pages")
-    
-    def max_pages(self):
-        soup = BeautifulSoup(get(self.build_url_by_page(1)).text, features="lxml")
-        pages = soup.find('div', class_='propertyhive-pagination').find_all('a')[-2].text.strip()
+
+    def first_page_url(self):
+        return self.build_url_by_page(1)
+
+    def count_pages(self, soup):
+        pages = text(self.XPATH_PAGINATION(soup)[-2]).strip()
         return int(pages)
+
+    def max_pages(self):
+        pages = self.discover()
+        log(f"[DIRECT HOUSING] Found {pages} pages", "INFO")
+        return pages
     
-    def reprocess_properties(self):
-        new_properties = []
-        for index, property in enumerate(self.properties):
-            log(f"[DIRECT HOUSING] [{index}/{len(self.properties)}] Getting more data about... {property['title']}")
-            property = self.get_property_info(property)
-            new_properties.append(property)
-        self.properties = new_properties
+    def detail(self, property, index, total):
+        if LOG_DEBUG:
+            log(f"[DIRECT HOUSING] [{index}/{total}] Getting more data about... {property['title']}")
+        return self.get_property_info(property)
 
     def build_url_by_page(self, page):
         return self.BASE_LINK[0] + str(page) + self.BASE_LINK[1]
 
     def find_first(self):
-        self.get_page_info(self.build_url_by_page(1))
-        self.reprocess_properties()
+        self.collect(stream_details([self.build_url_by_page(1)], self.get_page_info, self.enrich, self.DETAIL_WORKERS))
     
     def find_all(self):
-        for i in range(1, self.pages + 1):
-            self.get_page_info(self.build_url_by_page(i))
-        self.reprocess_properties()
+        self.max_pages()
+        urls = [self.build_url_by_page(i) for i in range(1, self.pages + 1)]
+        self.collect(stream_details(urls, self.get_page_info, self.enrich, self.DETAIL_WORKERS))
 
     def get_page_info(self, url):
-        soup = BeautifulSoup(get(url).text, features="lxml")
+        soup = self.fetch_page(url)
 
-        log(f"[DIRECT HOUSING] Getting page info from... {url}")
+        if LOG_DEBUG:
+            log(f"[DIRECT HOUSING] Getting page info from... {url}")
 
-        properties_raw = soup.find_all('div', class_='details')
-        log(len(properties_raw))
+        properties_raw = self.XPATH_CARDS(soup)
+        if LOG_DEBUG:
+            log(len(properties_raw))
+
+        properties = []
 
         for index, property_raw in enumerate(properties_raw):
             try:
-                property = {}
+                property = listing()
 
-                property['source'] = "Direct Housing"
-                property['title'] = property_raw.find('h3').text.strip()
-                log(f"[DIRECT HOUSING] Getting basic data about... {property['title']}")
-                property['url'] = property_raw.find('a')['href']
+                property['source'] = self.SOURCE
+                property['title'] = text(self.XPATH_TITLE(property_raw)[0]).strip()
+                if LOG_DEBUG:
+                    log(f"[DIRECT HOUSING] Getting basic data about... {property['title']}")
+                property['url'] = self.XPATH_LINK(property_raw)[0].attrib['href']
                 
                 try:
-                    property['price'] = property_raw.find('div', class_='price').text.strip()
+                    property['price'] = text(self.XPATH_PRICE(property_raw)[0]).strip()
                 except:
                     property['price'] = "Unknown"
                 
                 try:
-                    property['status'] = property_raw.find('div', class_='availability').text.strip()
+                    property['status'] = text(self.XPATH_AVAILABILITY(property_raw)[0]).strip()
                 except:
                     property['status'] = "Unknown"
 
@@ -618,41 +2381,35 @@ class direct_housing():
                 # property['beds'] = property_raw.find('span', class_='propertyhive-bedrooms').text.strip()
                 # property['baths'] = property_raw.find('span', class_='propertyhive-bathrooms').text.strip()
 
-                self.properties.append(property)
+                properties.append(property)
             except:
-                log(f"ERROR - Could not find basic data about {index + 1}")
+                log(f"Could not find basic data about {index + 1}", "ERROR")
+        return properties
         
     
     def get_property_info(self, property):
-        soup = BeautifulSoup(get(property["url"]).text, features="lxml")
-
-        log(f"[DIRECT HOUSING] Getting more data about... {property['title']}")
+        if LOG_DEBUG:
+            log(f"[DIRECT HOUSING] Getting more data about... {property['title']}")
+        return self.fetch_detail(property["url"], property, self.parse_property_info)
 
+    def parse_property_info(self, soup, property):
         try:
-            property["beds"] = soup.find('div', class_='elementor-widget-bedrooms').text.strip()
+            property["beds"] = text(self.XPATH_BEDROOMS(soup)[0]).strip()
         except:
             property["beds"] = "Unknown"
 
         try:
-            property["baths"] = soup.find('div', class_='elementor-widget-bathrooms').text.strip()
+            property["baths"] = text(self.XPATH_BATHROOMS(soup)[0]).strip()
         except:
             property["baths"] = "Unknown"
 
-        try:
-            for script in soup.find_all('script', class_=None, id=None, type=None):
-                try:
-                    raw_lat_lng = script.text.split("google.maps.LatLng(")[1]
-                    raw_lat_lng = raw_lat_lng.split(")")[0]
-                    raw_lat_lng = raw_lat_lng.split(", ")
-                    property['lat'] = raw_lat_lng[0].strip()
-                    property['lon'] = raw_lat_lng[1].strip()
-                except:
-                    pass
-        except:
-            pass
+        for script in self.XPATH_PLAIN_SCRIPTS(soup):
+            raw_lat_lng = REGEX_GOOGLE_LATLNG.search(script_text(script))
+            if raw_lat_lng:
+                split_coordinates(property, raw_lat_lng.group(1), ", ")
 
         if 'lat' not in property or 'lon' not in property:
-            log(f"ERROR - Could not find lat/long for {property['title']}")
+            log(f"Could not find lat/long for {property['title']}", "ERROR")
             property['lat'] = "Unknown"
             property['lon'] = "Unknown"
         
@@ -666,162 +2423,696 @@ class direct_housing():
         property['status'] = "Unknown"
 
         return property
-    
-    def save_to_json(self):
-        with open('direct_housing.json', 'w') as f:
-            json.dump(self.properties, f, sort_keys=True, indent=4)
-    
-
 
+AGENT_MODES = ("all", "first")
 
-def all():
-    outputs = []
-    
-    x = house_hunt()
-    y = easy_lettings()
+def run_agent(agent, mode="all"):
+    # Keeps whatever the agent collected before it failed instead of dying silently
+    agent.started = time.time()
+    agent.status = "running"
     try:
-        z = oakmans()
+        agent.open_output()
+        if mode == "first":
+            agent.find_first()
+        else:
+            agent.find_all()
+    except agent_cancelled:
+        agent.status = "cancelled"
+        log(f"{type(agent).__name__} cancelled after {time.time() - agent.started:.0f}s, keeping {len(agent.properties)} properties", "WARNING")
+        agent.close_output(complete=False)
+    except circuit_open as e:
+        agent.status = "aborted"
+        log(f"{type(agent).__name__} aborted: {e}", "ERROR")
+        agent.close_output(complete=False)
     except Exception as e:
-        print("Could not find Oakmans")
-        print(e)
-        pass
-    a = purple_frog()
-    b = king_co()
-    c = direct_housing()
-
-    t1 = threading.Thread(target=x.find_all)
-    t2 = threading.Thread(target=y.find_all)
-    
-    try:
-        t3 = threading.Thread(target=z.find_all)
-    except:
-        pass
-    t4 = threading.Thread(target=a.find_all)
-    t5 = threading.Thread(target=b.find_all)
-    t6 = threading.Thread(target=c.find_all)
-
-    t1.start()
-    t2.start()
-    try:
-        t3.start()
-    except:
-        pass
-    t4.start()
-    t5.start()
-
-    try:
-        t6.start()
-    except:
-        pass
-
-
-    t1.join()
-    t2.join()
-    try:
-        t3.join()
-    except:
-        pass
-    t4.join()
-    t5.join()
-
-    try:
-        t6.join()
-    except:
-        pass
-
-
-    # x.find_all()
-    # # x.find_first()
-    x.save_to_json()
-    outputs = outputs + x.properties
-
-    # y.find_first()
-    # y.find_all()
-    y.save_to_json()
-    outputs = outputs + y.properties
-
-    # # z.find_first()
-    # z.find_all()
-    try:
-        z.save_to_json()
-        outputs = outputs + z.properties
-    except:
-        pass
-
-    # a.find_first()
-    # a.find_all()
-    a.save_to_json()
-    outputs = outputs + a.properties
-
-    # b.find_first()
-    # b.find_all()
-    b.save_to_json()
-    outputs = outputs + b.properties
+        agent.status = "failed"
+        log(f"{type(agent).__name__} failed after {len(agent.properties)} properties: {e!r}", "ERROR")
+        agent.close_output(complete=False)
+    else:
+        agent.status = "done"
+        # A run that found nothing is far more often a blocked or broken site than an agent
+        # with no listings, so it doesn't replace the last complete output
+        agent.close_output(complete=bool(agent.properties))
+    finally:
+        METRICS.set("agent_seconds", round(time.time() - agent.started, 3), agent=type(agent).__name__)
+        METRICS.set("agent_properties", len(agent.properties), agent=type(agent).__name__)
+        METRICS.inc("agent_runs_total", agent=type(agent).__name__, status=agent.status)
+
+def create_agents(client=None, names=None):
+    # A constructor that raises only costs its own agent
+    agents = []
+    for name, agent_class in AGENTS.items():
+        if names is not None and name not in names:
+            continue
+        try:
+            agents.append(agent_class(client))
+        except Exception as e:
+            log(f"Could not create {name}: {e!r}", "ERROR")
+    return agents
+
+def schedule_agents(agents, workers=AGENT_WORKERS, grace=AGENT_CANCEL_GRACE, mode="all"):
+    # Runs the agents on a fixed set of worker threads, lowest PRIORITY first. An agent past
+    # its DEADLINE is cancelled; if it still hasn't stopped after the grace period the run
+    # moves on and publishes whatever it had collected.
+    if not agents:
+        return agents
+    if workers <= 0:
+        # One agent at a time on the calling thread, without deadlines, so a profile sees every call
+        for agent in sorted(agents, key=lambda agent: agent.PRIORITY):
+            with stage(f"agent-{type(agent).__name__}"):
+                run_agent(agent, mode)
+        return agents
+
+    # Daemon threads rather than an executor: interpreter exit joins executor workers, so an
+    # agent that ignores cancellation would hold the process open long after publishing
+    waiting = queue.Queue()
+    for agent in sorted(agents, key=lambda agent: agent.PRIORITY):
+        waiting.put(agent)
+    finished = set()
+    changed = threading.Condition()
+
+    def work():
+        while True:
+            try:
+                agent = waiting.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                run_agent(agent, mode)
+            finally:
+                with changed:
+                    finished.add(agent)
+                    changed.notify_all()
 
-    c.save_to_json()
-    # c.find_first()
-    # c.find_all()
-    outputs = outputs + c.properties
+    threads = [threading.Thread(target=work, name=f"agent_{i}", daemon=True) for i in range(max(1, min(workers, len(agents))))]
+    for thread in threads:
+        thread.start()
 
     try:
-        outputs = manual_checks(outputs)
-    except:
-        log(f"{COLOURS['FAIL']}ERROR{COLOURS['ENDC']} - Could not run manual checks")
-
-    with open('combined.json', 'w') as f:
-        json.dump(outputs, f, sort_keys=True, indent=4)
+        while True:
+            with changed:
+                pending = [agent for agent in agents if agent not in finished]
+                if not pending:
+                    break
+                changed.wait(timeout=1)
+                pending = [agent for agent in agents if agent not in finished]
+            if not pending:
+                break
+
+            now = time.time()
+            for agent in pending:
+                if agent.started is not None and not agent.cancelled.is_set() and now - agent.started > agent.DEADLINE:
+                    log(f"{type(agent).__name__} passed its {agent.DEADLINE:.0f}s deadline, cancelling", "WARNING")
+                    agent.cancel()
+
+            # Give up once every running agent is stuck and none is left that a free worker could start
+            running = [agent for agent in pending if agent.started is not None]
+            stuck = [agent for agent in running if agent.cancelled_at is not None and now - agent.cancelled_at > grace]
+            if stuck and len(stuck) == len(running) and (len(stuck) == len(pending) or len(stuck) >= len(threads)):
+                for agent in stuck:
+                    log(f"{type(agent).__name__} did not stop, publishing its {len(agent.properties)} properties", "ERROR")
+                for agent in pending:
+                    if agent.started is None:
+                        agent.cancel()
+                        log(f"{type(agent).__name__} never started, every worker is stuck", "ERROR")
+                break
+    except KeyboardInterrupt:
+        for agent in agents:
+            agent.cancel()
+        raise
+    return agents
+
+def all(client=None, incremental=INCREMENTAL, names=None, mode="all"):
+    client = client or default_client()
+
+    agents = create_agents(client, names)
+
+    if incremental:
+        snapshot = load_snapshot()
+        for agent in agents:
+            agent.use_snapshot(snapshot)
+
+    # Profiling runs the agents inline, each under its own profile, so the crawl itself isn't profiled
+    if PROFILE_DIR:
+        for agent in agents:
+            agent.DETAIL_WORKERS = 0
+    # Started before any agent thread exists rather than lazily from one of them
+    parse_pool()
+    with stage("crawl", profile=False):
+        schedule_agents(agents, workers=0 if PROFILE_DIR else AGENT_WORKERS, mode=mode)
+
+    close_parse_pool()
+
+    # Per-agent output was already streamed to OUTPUT_DIR while the agents ran; an agent
+    # that was left running contributes what it had at this point, and agents that were
+    # not selected, or that collected nothing (a failure, or every listing page erroring),
+    # contribute their last complete output
+    ran = {type(agent).__name__: agent for agent in agents}
+    outputs = []
+    for name in AGENTS:
+        if name in ran and ran[name].properties:
+            outputs.extend(list(ran[name].properties))
+        elif name in ran or names is not None:
+            previous = load_outputs((name,))
+            if name in ran:
+                log(f"{name} {ran[name].status} without collecting any properties, using its last complete output ({len(previous)} properties)", "WARNING")
+            outputs.extend(previous)
+
+    if incremental:
+        for agent in agents:
+            log(f"[INCREMENTAL] {type(agent).__name__}: {agent.changes['new']} new, {agent.changes['changed']} changed, {agent.changes['unchanged']} unchanged, {len(agent.removed())} removed", "INFO")
+
+    if client.cache is not None:
+        client.cache.prune()
+
+    # An empty run would overwrite the published data with nothing
+    if not outputs:
+        log("No properties from any agent, not publishing", "ERROR")
+        return False
+    publish(outputs, client)
+    return True
+
+def load_outputs(names=None, directory=OUTPUT_DIR):
+    outputs = []
+    for name in AGENTS:
+        if names is None or name in names:
+            outputs.extend(read_ndjson(os.path.join(directory, f"{name}.ndjson")))
+    return outputs
+
+def publish(outputs, client=None):
+    # Everything after the crawl: geocoding, defaults, typed fields, dedup and the site data
+    with stage("geocode"):
+        try:
+            outputs = manual_checks(outputs, client)
+        except:
+            log("Could not run manual checks", "ERROR")
+
+    with stage("normalise"):
+        normalise_stage(outputs)
+    with stage("dedup"):
+        outputs = dedup_stage(outputs)
+
+    with stage("write"):
+        write_combined(outputs)
+        write_map_bundle(outputs)
+    METRICS.set("published_properties", len(outputs))
+
+def run_report(metrics=None):
+    # Per-agent and per-stage summary of the metrics, with the raw series alongside
+    counters, gauges, histograms = (metrics or METRICS).snapshot()
+    report = {"created": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'), "stages": {}, "agents": {}, "http": {}, "geocode": {}}
+
+    def agent_stats(name):
+        return report["agents"].setdefault(name, {"status": None, "seconds": None, "properties": None, "records": 0, "requests": {}, "cached_requests": 0, "bytes": 0, "detail_reused": 0, "request_seconds": {}, "parse_seconds": {}})
+
+    for (name, labels), value in gauges.items():
+        labels = dict(labels)
+        if name == "stage_seconds":
+            report["stages"][labels["stage"]] = value
+        elif name == "agent_seconds":
+            agent_stats(labels["agent"])["seconds"] = value
+        elif name == "agent_properties":
+            agent_stats(labels["agent"])["properties"] = value
+        elif name == "published_properties":
+            report["published"] = value
+
+    for (name, labels), value in counters.items():
+        labels = dict(labels)
+        if name == "agent_requests_total":
+            stats = agent_stats(labels["agent"])
+            stats["requests"][labels["kind"]] = stats["requests"].get(labels["kind"], 0) + value
+            if labels["cached"] == "true":
+                stats["cached_requests"] += value
+        elif name == "agent_response_bytes_total":
+            agent_stats(labels["agent"])["bytes"] += value
+        elif name == "agent_records_total":
+            agent_stats(labels["agent"])["records"] += value
+        elif name == "agent_detail_reused_total":
+            agent_stats(labels["agent"])["detail_reused"] += value
+        elif name == "agent_runs_total":
+            agent_stats(labels["agent"])["status"] = labels["status"]
+        elif name == "http_requests_total":
+            report["http"].setdefault(labels["host"], {})[str(labels["status"])] = value
+        elif name == "http_retries_total":
+            report["http"].setdefault(labels["host"], {})["retries"] = value
+        elif name == "geocode_lookups_total":
+            report["geocode"][labels["result"]] = value
+
+    for (name, labels), histogram in histograms.items():
+        labels = dict(labels)
+        if name in ("agent_request_seconds", "agent_parse_seconds"):
+            agent_stats(labels["agent"])[name[len("agent_"):]][labels["kind"]] = {
+                "count": histogram["count"],
+                "total": round(histogram["sum"], 6),
+                "mean": round(histogram["sum"] / histogram["count"], 6) if histogram["count"] else 0.0,
+            }
+
+    report["metrics"] = {
+        "counters": [{"name": name, "labels": dict(labels), "value": value} for (name, labels), value in sorted(counters.items(), key=str)],
+        "gauges": [{"name": name, "labels": dict(labels), "value": value} for (name, labels), value in sorted(gauges.items(), key=str)],
+        "histograms": [{"name": name, "labels": dict(labels), "buckets": list(METRICS.buckets), **histogram} for (name, labels), histogram in sorted(histograms.items(), key=str)],
+    }
+    return report
+
+def write_metrics(report_path=RUN_REPORT_PATH, metrics_path=METRICS_PATH):
+    if report_path:
+        with open(report_path, 'w') as f:
+            json.dump(run_report(), f, indent=4, default=str)
+    if metrics_path:
+        with open(metrics_path + '.tmp', 'w') as f:
+            f.write(METRICS.prometheus())
+        os.replace(metrics_path + '.tmp', metrics_path)
+
+def known(value):
+    return value is not None and value != "Unknown" and value != "" and value != []
+
+def parse_quality_gate(gate=QUALITY_GATE):
+    thresholds = {}
+    for rule in gate.split(','):
+        if '=' in rule:
+            field, minimum = rule.split('=', 1)
+            thresholds[field.strip()] = float(minimum)
+    return thresholds
+
+def quality_report(properties, bounds=SELLY_OAK_BOUNDS, fields=QUALITY_FIELDS):
+    # One pass with per-source counters; only the offending records are kept
+    south, west, north, east = bounds
+    sources = {}
+    totals = dict.fromkeys(fields, 0)
 
-def post_check():
-    with open('combined.json', 'r') as f:
+    for property in properties:
+        source = property.get('source') or "Unknown"
+        if source not in sources:
+            sources[source] = {"count": 0, "present": dict.fromkeys(fields, 0), "invalid_coordinates": [], "unparseable_prices": []}
+        stats = sources[source]
+        stats["count"] += 1
+
+        for field in fields:
+            if known(property.get(field)):
+                stats["present"][field] += 1
+                totals[field] += 1
+
+        if known(property.get('lat')) or known(property.get('lon')):
+            lat = normalise_coordinate(property.get('lat'))
+            lon = normalise_coordinate(property.get('lon'))
+            if lat is None or lon is None or not (south <= lat <= north and west <= lon <= east):
+                stats["invalid_coordinates"].append({"title": property.get('title'), "url": property.get('url'), "lat": property.get('lat'), "lon": property.get('lon')})
+
+        if known(property.get('price')) and normalise_price(property.get('price')) is None:
+            stats["unparseable_prices"].append({"title": property.get('title'), "url": property.get('url'), "price": property.get('price')})
+
+    def coverage(present, count):
+        return {field: round(present[field] / count * 100, 1) if count else 0.0 for field in fields}
+
+    total = sum(stats["count"] for stats in sources.values())
+    return {
+        "total": total,
+        "coverage": coverage(totals, total),
+        "bounds": list(bounds),
+        "sources": {source: {
+            "count": stats["count"],
+            "coverage": coverage(stats["present"], stats["count"]),
+            "invalid_coordinates": stats["invalid_coordinates"],
+            "unparseable_prices": stats["unparseable_prices"],
+        } for source, stats in sources.items()},
+    }
+
+def quality_failures(report, thresholds):
+    failures = []
+    for source, stats in report["sources"].items():
+        for field, minimum in thresholds.items():
+            if stats["coverage"].get(field, 0.0) < minimum:
+                failures.append(f"{source}: {field} coverage {stats['coverage'].get(field, 0.0)}% is below {minimum}%")
+    return failures
+
+def post_check(path=COMBINED_PATH, report_path=QUALITY_REPORT_PATH, gate=QUALITY_GATE):
+    # Writes the data-quality report and returns False when the run gate fails
+    with open(path, 'r') as f:
         properties = json.load(f)
 
-    no_lat_long = []
-    sources = []
+    report = quality_report(properties)
+    report["failures"] = quality_failures(report, parse_quality_gate(gate))
+    with open(report_path, 'w') as f:
+        json.dump(report, f, indent=4)
 
-    for property in properties:
-        if 'lat' not in property:
-            log(f"ERROR - Could not find lat/long for {property['title']}")
-            if property not in no_lat_long:
-                no_lat_long.append(property)
-        if 'lon' not in property:
-            log(f"ERROR - Could not find lat/long for {property['title']}")
-            if property not in no_lat_long:
-                no_lat_long.append(property)
-
-        if 'available_date' not in property:
-            log(f"ERROR - Could not find available date for {property['title']}")
-        if 'beds' not in property:
-            log(f"ERROR - Could not find beds for {property['title']}")
-        if 'baths' not in property:
-            log(f"ERROR - Could not find baths for {property['title']}")
-        if 'price' not in property:
-            log(f"ERROR - Could not find price for {property['title']}")
-        if 'source' not in property:
-            log(f"ERROR - Could not find source for {property['title']}")
-        else:
-            if property['source'] not in sources:
-                sources.append(property['source'])
-    if len(no_lat_long) > 0 & len(properties) > 0:
-        print(f"Found {len(no_lat_long)} ({int(len(no_lat_long)/len(properties) * 100)}%) properties with no lat/long:")
-    for property in no_lat_long:
-        print(f" - {property['title']} ({property['source']})")
+    for source, stats in report["sources"].items():
+        missing = ", ".join(f"{field} {stats['coverage'][field]}%" for field in QUALITY_FIELDS if stats['coverage'][field] < 100)
+        print(f"{source}: {stats['count']} properties, {len(stats['invalid_coordinates'])} invalid coordinates, {len(stats['unparseable_prices'])} unparseable prices{'; coverage ' + missing if missing else ''}")
+    for failure in report["failures"]:
+        print(f"{COLOURS['FAIL']}QUALITY GATE{COLOURS['ENDC']} - {failure}")
+    return not report["failures"]
 
 def test_geocode(property={"title": "115 Tiverton Road", "source": "House Hunt"}):
     print(geocode_property(property))
 
-def manual_checks(properties):
-    edited_properties = []
-
+class geoapify_stub():
+    # Local stand-in for the Geoapify search endpoint, answers from {normalised query: result}.
+    # A result that is an int is sent back as that HTTP status with an HTML error page.
+    def __init__(self, results, port=0, latency=0) -> None:
+        import http.server
+        stub = self
+        self.results = results
+        self.latency = latency
+        self.requests = 0
+
+        class handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                stub.requests += 1
+                time.sleep(stub.latency)
+                params = urllib.parse.parse_qs(urllib.parse.urlsplit(self.path).query)
+                result = stub.results.get(normalise_query(params.get('text', [''])[0]))
+
+                if isinstance(result, int):
+                    body = f"<html><body><h1>{result}</h1></body></html>".encode()
+                    self.send_response(result)
+                    self.send_header("Content-Type", "text/html")
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                    return
+
+                features = []
+                if result:
+                    features.append({"type": "Feature", "properties": dict(result), "geometry": {"type": "Point", "coordinates": [result['lon'], result['lat']]}})
+                body = json.dumps({"type": "FeatureCollection", "features": features}).encode()
+
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = http.server.ThreadingHTTPServer(('127.0.0.1', port), handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}/v1/geocode/search"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+
+class fixture_client():
+    # Offline stand-in for http_client. Agents fetch listing pages with client.get(url) and
+    # detail pages with client.get(url, cache=True), so that flag picks the fixture.
+    CONTENT_TYPES = {'.html': 'text/html; charset=UTF-8', '.json': 'application/json'}
+
+    def __init__(self, listing_path, detail_path=None) -> None:
+        self.cache = None
+        self.entries = {}
+        for kind, path in (("listing", listing_path), ("detail", detail_path)):
+            if path:
+                with open(path, 'rb') as f:
+                    self.entries[kind] = {"body": f.read(), "encoding": "utf-8", "content_type": self.CONTENT_TYPES.get(os.path.splitext(path)[1]), "digest": None}
+        self.requests = dict.fromkeys(self.entries, 0)
+
+    def fresh(self):
+        # Same pages with the request counts reset, without reading the files again
+        client = fixture_client(None)
+        client.entries = self.entries
+        client.requests = dict.fromkeys(self.entries, 0)
+        return client
+
+    def get(self, url, raise_for_status=True, cache=False, **kwargs):
+        kind = "detail" if cache else "listing"
+        if kind not in self.entries:
+            from requests import RequestException
+            raise RequestException(f"No {kind} fixture for {url}")
+        self.requests[kind] += 1
+        resp = cached_response(url, self.entries[kind])
+        resp.from_cache = False
+        return resp
+
+class capture_client():
+    # Wraps a live or replaying client and keeps the first listing and detail response an
+    # agent fetches, for bench_capture(). The digest is dropped so the agent parses every
+    # detail page instead of reusing stored fields.
+    def __init__(self, client) -> None:
+        self.client = client
+        self.cache = None
+        self.pages = {}
+
+    def get(self, url, raise_for_status=True, cache=False, **kwargs):
+        resp = self.client.get(url, raise_for_status, cache, **kwargs)
+        resp.digest = None
+        kind = "detail" if cache else "listing"
+        if kind not in self.pages and resp.status_code == 200:
+            self.pages[kind] = resp
+        return resp
+
+def bench_capture(names=None, client=None, directory=BENCH_FIXTURES_DIR):
+    # Replaces the fixtures with each agent's first listing page and first detail page as
+    # the site serves them (or as a cassette recorded them)
+    client = client or default_client()
+    for name in AGENTS:
+        if names is not None and name not in names:
+            continue
+        recorder = capture_client(client)
+        agent = AGENTS[name](recorder)
+        agent.DETAIL_WORKERS = 0
+        try:
+            agent.find_first()
+        except Exception as e:
+            log(f"[BENCH] {name} failed while capturing: {e!r}", "WARNING")
+
+        folder = os.path.join(directory, name)
+        os.makedirs(folder, exist_ok=True)
+        for kind, resp in recorder.pages.items():
+            extension = '.json' if 'json' in resp.headers.get('Content-Type', '') else '.html'
+            for old in bench_fixtures(name, directory).values():
+                if os.path.splitext(os.path.basename(old))[0] == kind:
+                    os.remove(old)
+            with open(os.path.join(folder, kind + extension), 'wb') as f:
+                f.write(resp.content)
+        log(f"[BENCH] Captured {', '.join(recorder.pages) or 'nothing'} for {name}", "INFO")
+
+def bench_fixtures(name, directory=BENCH_FIXTURES_DIR):
+    paths = {}
+    folder = os.path.join(directory, name)
+    if os.path.isdir(folder):
+        for file in sorted(os.listdir(folder)):
+            kind = os.path.splitext(file)[0]
+            if kind in ("listing", "detail"):
+                paths[kind] = os.path.join(folder, file)
+    return paths
+
+BENCH_REFERENCE_PAGE = b"<html><body>" + b"".join(b'<div class="card"><a href="/property/%d">%d Test Road</a><span>%d pw</span></div>' % (i, i, i * 10) for i in range(50)) + b"</body></html>"
+
+def bench_reference():
+    # Fixed parse-and-walk work timed next to every round. Stages are also reported relative
+    # to it, so the regression gate compares the code rather than the machine's speed that minute.
+    # It calls lxml directly so a slowdown in the scraper's own helpers can't cancel out.
+    from lxml import html as lxml_html
+    document = lxml_html.document_fromstring(BENCH_REFERENCE_PAGE)
+    return sum(len(element.text_content()) for element in document.iter('div'))
+
+def bench_stage(run, rounds, min_seconds=BENCH_MIN_ROUND_SECONDS):
+    # Each round loops the stage until it takes min_seconds, then times the reference work
+    # the same way. seconds is the fastest round; relative is the median of stage time over
+    # reference time. One more run under tracemalloc gives the Python heap peak.
+    import contextlib, gc, statistics, tracemalloc
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        pages, properties = run()
+
+        # Like timeit, with the collector off so a collection doesn't land in one round and not another
+        def timed(work, loops):
+            enabled = gc.isenabled()
+            gc.disable()
+            try:
+                start = time.perf_counter()
+                for _ in range(loops):
+                    work()
+                return (time.perf_counter() - start) / loops
+            finally:
+                if enabled:
+                    gc.enable()
+
+        def calibrate(work):
+            loops = 1
+            while timed(work, loops) * loops < min_seconds:
+                loops *= 2
+            return loops
+
+        loops, reference_loops = calibrate(run), calibrate(bench_reference)
+        times, ratios = [], []
+        for _ in range(rounds):
+            seconds = timed(run, loops)
+            times.append(seconds)
+            ratios.append(seconds / timed(bench_reference, reference_loops))
+
+        tracemalloc.start()
+        try:
+            run()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    seconds = min(times)
+    return {
+        "pages": pages,
+        "properties": properties,
+        "loops": loops,
+        "seconds": round(seconds, 6),
+        "relative": round(statistics.median(ratios), 4),
+        "pages_per_s": round(pages / seconds, 1) if seconds else 0.0,
+        "properties_per_s": round(properties / seconds, 1) if seconds else 0.0,
+        "peak_kib": round(peak / 1024, 1),
+    }
+
+def bench_agent(name, rounds=BENCH_ROUNDS, directory=BENCH_FIXTURES_DIR):
+    # Three stages over the agent's own find_first(): listing pages only, detail pages only,
+    # and the whole agent with its detail pipeline. Details are parsed inline: a pool of
+    # fetch threads per round would time thread start-up rather than the parsers.
+    fixtures = bench_fixtures(name, directory)
+    if "listing" not in fixtures:
+        return None
+    agent_class = AGENTS[name]
+    # Read once, so the timings don't include opening the fixture files
+    listing_only = fixture_client(fixtures["listing"])
+    pages = fixture_client(fixtures["listing"], fixtures.get("detail"))
+
+    # The listing stage leaves its cards behind for the detail stage
+    cards = []
+    def listing_stage():
+        client = listing_only.fresh()
+        agent = agent_class(client)
+        agent.DETAIL_WORKERS = 0
+        agent.enrich = lambda property, index, total: property
+        agent.find_first()
+        cards[:] = [property.copy() for property in agent.properties if property.get('url')]
+        return client.requests["listing"], len(agent.properties)
+
+    def detail_stage():
+        client = pages.fresh()
+        agent = agent_class(client)
+        for index, card in enumerate(cards):
+            agent.detail(card.copy(), index, len(cards))
+        return client.requests["detail"], len(cards)
+
+    def agent_stage():
+        client = pages.fresh()
+        agent = agent_class(client)
+        agent.DETAIL_WORKERS = 0
+        agent.find_first()
+        return sum(client.requests.values()), len(agent.properties)
+
+    results = {"listing": bench_stage(listing_stage, rounds)}
+    if "detail" in fixtures and cards and hasattr(agent_class, 'detail'):
+        results["detail"] = bench_stage(detail_stage, rounds)
+    results["agent"] = bench_stage(agent_stage, rounds)
+    return results
+
+LEGACY_REGEX_DATE = r'^(?:(?:31(\/|-|\.)(?:0?[13578]|1[02]))\1|(?:(?:29|30)(\/|-|\.)(?:0?[13-9]|1[0-2])\2))(?:(?:1[6-9]|[2-9]\d)?\d{2})$|^(?:29(\/|-|\.)0?2\3(?:(?:(?:1[6-9]|[2-9]\d)?(?:0[48]|[2468][048]|[13579][26])|(?:(?:16|[2468][048]|[3579][26])00))))$|^(?:0?[1-9]|1\d|2[0-8])(\/|-|\.)(?:(?:0?[1-9])|(?:1[0-2]))\4(?:(?:1[6-9]|[2-9]\d)?\d{2})$'
+
+def legacy_available_date(content, today=None):
+    # The line-by-line loop Easy Lettings used before extract_available_date(), kept as the
+    # baseline for the bench's extract stage
+    today = today or datetime.datetime.today().strftime('%d/%m/%Y')
+    available_date = "Unknown"
+    for line in content.split('\n'):
+        line = line.lower()
+
+        if "available now" in line:
+            available_date = today
+        elif "available from: " in line:
+            raw_date = line.split('available from:')[1].strip()
+            if re.match(LEGACY_REGEX_DATE, raw_date):
+                available_date = raw_date
+            elif ' ' in raw_date:
+                available_date = raw_date.split(' ')[0]
+        elif "available: " in line:
+            raw_date = line.split('available:')[1].strip()
+            if re.match(LEGACY_REGEX_DATE, raw_date):
+                available_date = raw_date
+            elif ' ' in raw_date:
+                available_date = raw_date.split(' ')[0]
+        elif "available " in line:
+            raw_date = line.split('available ')[1].strip()
+            if re.match(LEGACY_REGEX_DATE, raw_date):
+                available_date = raw_date
+            elif ' ' in raw_date:
+                raw_date = raw_date.split(' ')[0]
+                if re.match(LEGACY_REGEX_DATE, raw_date):
+                    available_date = raw_date
+    return available_date
+
+def bench_extract(rounds=BENCH_ROUNDS, directory=BENCH_FIXTURES_DIR):
+    # The available-date extractor against the legacy loop over the text of every HTML detail fixture
+    documents = []
+    for name in AGENTS:
+        path = bench_fixtures(name, directory).get("detail")
+        if path and path.endswith('.html'):
+            with open(path, 'rb') as f:
+                documents.append(text(parse_html(f.read(), 'utf-8')))
+    if not documents:
+        return None
+
+    results = {}
+    for stage, extract in (("legacy", legacy_available_date), ("extract_available_date", extract_available_date)):
+        def run(extract=extract):
+            for document in documents:
+                extract(document)
+            return len(documents), len(documents)
+        results[stage] = bench_stage(run, rounds)
+    results["speedup"] = round(results["legacy"]["relative"] / results["extract_available_date"]["relative"], 2)
+    return results
+
+def bench(names=None, rounds=BENCH_ROUNDS, directory=BENCH_FIXTURES_DIR):
+    import platform
+    results = {
+        "version": 1,
+        "created": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+        "python": platform.python_version(),
+        "rounds": rounds,
+        "agents": {},
+    }
+    for name in AGENTS:
+        if names is not None and name not in names:
+            continue
+        stages = bench_agent(name, rounds, directory)
+        if stages is None:
+            log(f"[BENCH] No fixtures for {name} in {directory}, skipping", "INFO")
+            continue
+        results["agents"][name] = stages
+        for stage, result in stages.items():
+            print(f"{name:>15} {stage:>8}: {result['pages_per_s']:>9.1f} pages/s {result['properties_per_s']:>9.1f} properties/s {result['peak_kib']:>8.1f} KiB peak")
+
+    extract = bench_extract(rounds, directory)
+    if extract is not None:
+        results["extract"] = extract
+        print(f"{'extract':>15} {'dates':>8}: {extract['legacy']['seconds'] / extract['legacy']['pages'] * 1e6:.1f}us per page legacy, {extract['extract_available_date']['seconds'] / extract['legacy']['pages'] * 1e6:.1f}us per page extract_available_date ({extract['speedup']}x)")
+    return results
+
+def bench_regressions(results, baseline, tolerance=BENCH_TOLERANCE):
+    # A stage regresses when its throughput falls more than tolerance below the baseline,
+    # measured against the reference work when both runs have it so a slower machine isn't
+    # reported as slower code
+    stages = [(f"{name} {stage}", result, baseline.get("agents", {}).get(name, {}).get(stage)) for name, agent_stages in results["agents"].items() for stage, result in agent_stages.items()]
+    if results.get("extract"):
+        stages.append(("extract available_date", results["extract"]["extract_available_date"], (baseline.get("extract") or {}).get("extract_available_date")))
+
+    regressions = []
+    for label, result, previous in stages:
+        if previous and previous.get("relative") and result.get("relative"):
+            change = previous["relative"] / result["relative"] - 1
+            if change < -tolerance:
+                regressions.append(f"{label}: {previous['relative']} -> {result['relative']} x reference ({change:+.0%})")
+        elif previous and previous.get("pages_per_s"):
+            change = result["pages_per_s"] / previous["pages_per_s"] - 1
+            if change < -tolerance:
+                regressions.append(f"{label}: {previous['pages_per_s']} -> {result['pages_per_s']} pages/s ({change:+.0%})")
+    return regressions
+
+def manual_checks(properties, client=None):
     MANUAL_PROPERTIES = [
         {"title": "107 TIVERTON ROAD", "source": "King & Co"},
         {"title": "43 Alton Road", "source": "Easy Lettings"},
     ]
+    manual_titles = {manual_property['title'] for manual_property in MANUAL_PROPERTIES}
+
+    # At most one geocode per property, before any "Unknown" defaults are filled in
+    geocode_stage(properties, client, force_titles=manual_titles)
     
     for property in properties:
-        if 'lat' not in property:
-            property = geocode_property(property)
-        if 'lon' not in property:
-            property = geocode_property(property)
         if 'available_date' not in property:
             property['available_date'] = "Unknown"
         if 'beds' not in property:
@@ -839,26 +3130,173 @@ def manual_checks(properties):
         if 'address' not in property:
             property['address'] = "Unknown"
 
-        for manual_property in MANUAL_PROPERTIES:
-            if manual_property['title'] == property['title']:
-                property = geocode_property(property)
-
-        edited_properties.append(property)
-
-    return edited_properties
+    return properties
 
 def dh():
     outputs = []
     dh_obj = direct_housing()
     dh_obj.find_all()
-    outputs = outputs + dh_obj.properties
+    outputs.extend(dh_obj.properties)
     # dh_obj.save_to_json()
     with open('combined.json', 'w') as f:
-        json.dump(outputs, f, sort_keys=True, indent=4)
+        json.dump(outputs, f, sort_keys=True, indent=4, default=json_default)
 # dh()
 
-all()
-post_check()
+def agent_names(value):
+    names = [name.strip() for name in value.split(',') if name.strip()]
+    unknown = [name for name in names if name not in AGENTS]
+    if unknown:
+        raise argparse.ArgumentTypeError(f"unknown agent {', '.join(unknown)} (choose from {', '.join(AGENTS)})")
+    return names
+
+def cli_client(args):
+    return http_client(transport=args.transport, cassette_path=args.cassette)
+
+def command_scrape(args):
+    published = all(cli_client(args), incremental=args.incremental, names=args.agents, mode=args.mode)
+    write_metrics(args.run_report, args.metrics)
+    if not published:
+        return False
+    return args.no_check or post_check()
+
+def command_geocode(args):
+    if args.build_gazetteer:
+        # Published coordinates have all been through geocoding, so they seed the next run's gazetteer
+        if not os.path.exists(args.input):
+            log(f"No {args.input} to build the gazetteer from, run scrape first", "ERROR")
+            return False
+        with open(args.input, 'r') as f:
+            properties = json.load(f)
+        build_gazetteer(properties, args.gazetteer)
+        log(f"Rebuilt {args.gazetteer} from {len(properties)} properties in {args.input}", "INFO")
+        return True
+    client = cli_client(args)
+    if args.address:
+        print(geocode_property({"title": args.address, "source": args.source}, client))
+        return True
+    # Rebuilds combined.json from the stored per-agent output without crawling
+    outputs = load_outputs(args.agents)
+    if not outputs:
+        log(f"No agent output in {OUTPUT_DIR}, run scrape first", "ERROR")
+        return False
+    publish(outputs, client)
+    write_metrics(args.run_report, args.metrics)
+    return True
+
+def command_stub(args):
+    # Serves every address the geocode cache has found, e.g. for replayed or offline runs:
+    # GEOAPIFY_URL=<printed url> python3 main.py scrape
+    stub = geoapify_stub(geocode_cache(args.cache).results(), args.port, args.latency)
+    print(f"Geoapify stub with {len(stub.results)} addresses at {stub.url}")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        stub.close()
+    return True
+
+def command_check(args):
+    return post_check(args.input, args.report, args.gate)
+
+def command_export(args):
+    with open(args.input, 'r') as f:
+        properties = json.load(f)
+    # Snapshots written before the typed fields existed only have the raw strings;
+    # normalising again is harmless for newer ones
+    write_map_bundle(normalise_stage(properties), args.output)
+    return True
+
+def command_bench(args):
+    if args.capture:
+        bench_capture(args.agents, cli_client(args), args.fixtures)
+        return True
+    results = bench(args.agents, args.rounds, args.fixtures)
+    if args.output:
+        os.makedirs(os.path.dirname(args.output) or '.', exist_ok=True)
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=4)
+    if not args.compare:
+        return True
+    with open(args.compare, 'r') as f:
+        baseline = json.load(f)
+    regressions = bench_regressions(results, baseline, args.tolerance)
+    for regression in regressions:
+        print(f"{COLOURS['FAIL']}REGRESSION{COLOURS['ENDC']} - {regression}")
+    return not regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Scrape Selly Oak letting agents and build the site data.")
+    commands = parser.add_subparsers(dest="command")
+
+    parser.add_argument("--log-level", choices=[level.lower() for level in LOG_LEVELS], help="default from LOG_LEVEL, info")
+    parser.add_argument("--log-format", choices=("text", "json"), help="default from LOG_FORMAT, text")
+    parser.add_argument("--profile", metavar="DIR", help="write a cProfile .pstats per stage; agents then run one at a time on the main thread")
+
+    pipeline = argparse.ArgumentParser(add_help=False)
+    pipeline.add_argument("--transport", choices=("live", "record", "replay"), default=HTTP_TRANSPORT, help="fetch live, record every response to the cassette, or replay from it")
+    pipeline.add_argument("--cassette", default=HTTP_CASSETTE)
+    pipeline.add_argument("--run-report", default=RUN_REPORT_PATH, help="JSON run report with per-agent and per-stage metrics")
+    pipeline.add_argument("--metrics", default=METRICS_PATH, help="the same metrics in Prometheus text format")
+
+    scrape = commands.add_parser("scrape", parents=[pipeline], help="crawl agents, publish combined.json and the map data, then run the checks")
+    scrape.add_argument("--agents", type=agent_names, help="comma-separated agents to crawl; the others reuse their last output")
+    scrape.add_argument("--mode", choices=AGENT_MODES, default="all", help="crawl every listing page or only the first")
+    scrape.add_argument("--incremental", action=argparse.BooleanOptionalAction, default=INCREMENTAL, help="skip detail pages for unchanged listings")
+    scrape.add_argument("--no-check", action="store_true", help="skip the data-quality report")
+    scrape.set_defaults(run=command_scrape)
+
+    geocode = commands.add_parser("geocode", parents=[pipeline], help="re-geocode and republish the last agent output without crawling")
+    geocode.add_argument("--agents", type=agent_names, help="comma-separated agents to include")
+    geocode.add_argument("--address", help="look up a single address and print the result")
+    geocode.add_argument("--source", default="Unknown", help="source used for the --address lookup")
+    geocode.add_argument("--build-gazetteer", action="store_true", help="rebuild the gazetteer CSV from the coordinates in --input and exit")
+    geocode.add_argument("--input", default=COMBINED_PATH)
+    geocode.add_argument("--gazetteer", default=GAZETTEER_PATH)
+    geocode.set_defaults(run=command_geocode)
+
+    stub = commands.add_parser("stub", help="serve a local Geoapify endpoint from the geocode cache")
+    stub.add_argument("--port", type=int, default=8089)
+    stub.add_argument("--latency", type=float, default=0, help="seconds added to every answer")
+    stub.add_argument("--cache", default=GEOCODE_CACHE_PATH)
+    stub.set_defaults(run=command_stub)
+
+    check = commands.add_parser("check", help="write the data-quality report and apply the gate")
+    check.add_argument("--input", default=COMBINED_PATH)
+    check.add_argument("--report", default=QUALITY_REPORT_PATH)
+    check.add_argument("--gate", default=QUALITY_GATE, help="per-source minimum coverage, e.g. lat=90,price=80")
+    check.set_defaults(run=command_check)
+
+    export = commands.add_parser("export", help="rebuild the map data from combined.json")
+    export.add_argument("--input", default=COMBINED_PATH)
+    export.add_argument("--output", default=MAP_DATA_DIR)
+    export.set_defaults(run=command_export)
+
+    bench = commands.add_parser("bench", help="time the agent parsers offline on recorded pages")
+    bench.add_argument("--agents", type=agent_names, help="comma-separated agents to benchmark")
+    bench.add_argument("--rounds", type=int, default=BENCH_ROUNDS)
+    bench.add_argument("--fixtures", default=BENCH_FIXTURES_DIR)
+    bench.add_argument("--output", help="write the results as JSON")
+    bench.add_argument("--compare", help="earlier results to check for regressions")
+    bench.add_argument("--tolerance", type=float, default=BENCH_TOLERANCE, help="allowed throughput drop, 0.15 = 15%%")
+    bench.add_argument("--capture", action="store_true", help="replace the fixtures with each agent's first listing and detail page, fetched with --transport")
+    bench.add_argument("--transport", choices=("live", "record", "replay"), default=HTTP_TRANSPORT)
+    bench.add_argument("--cassette", default=HTTP_CASSETTE)
+    bench.set_defaults(run=command_bench)
+
+    # No subcommand keeps the old behaviour of a full scrape
+    argv = sys.argv[1:] if argv is None else list(argv)
+    args = parser.parse_args(argv)
+    if args.command is None:
+        args = parser.parse_args(argv + ["scrape"])
+
+    global PROFILE_DIR
+    set_logging(args.log_level, args.log_format)
+    if args.profile:
+        PROFILE_DIR = args.profile
+    return 0 if args.run(args) else 1
+
+if __name__ == "__main__":
+    raise SystemExit(main())
 # test_geocode({"title": "Renwick Apartments, Selly Oak, B29 7BL - Flat 303", "source": "House Hunt"})
 # test_geocode({"title": "63 Bristol Road Birmingham", "source": "Easy Lettings"})
 # test_geocode({"title": "107 TIVERTON ROAD", "source": "King & Co"})
\ No newline at end of file
@@ -0,0 +1,57 @@
+import filecmp
+import os
+
+import main
+
+
+def test_regressions_compare_against_the_reference_work():
+    baseline = {"agents": {"oakmans": {"listing": {"relative": 2.0, "pages_per_s": 1000.0}, "detail": {"pages_per_s": 1000.0}}}}
+    # The machine got twice as slow but the code did not
+    steady = {"agents": {"oakmans": {"listing": {"relative": 2.1, "pages_per_s": 500.0}, "detail": {"pages_per_s": 900.0}}}}
+    slower = {"agents": {"oakmans": {"listing": {"relative": 3.0, "pages_per_s": 1000.0}, "detail": {"pages_per_s": 700.0}}}}
+
+    assert main.bench_regressions(steady, baseline, 0.15) == []
+    assert [regression.split(':')[0] for regression in main.bench_regressions(slower, baseline, 0.15)] == ["oakmans listing", "oakmans detail"]
+
+
+def test_bench_stage_reports_relative_cost():
+    def run():
+        main.bench_reference()
+        main.bench_reference()
+        return 1, 1
+
+    result = main.bench_stage(run, 5, min_seconds=0.005)
+    # Twice the reference work, give or take the noise of a shared machine
+    assert 1.2 < result["relative"] < 3.5
+    assert result["seconds"] > 0
+
+
+def test_capture_writes_the_pages_the_agent_fetched(tmp_path):
+    name = "oakmans"
+    fixtures = main.bench_fixtures(name)
+    client = main.fixture_client(fixtures["listing"], fixtures["detail"])
+
+    main.bench_capture([name], client, str(tmp_path))
+
+    captured = main.bench_fixtures(name, str(tmp_path))
+    assert sorted(captured) == ["detail", "listing"]
+    for kind, path in captured.items():
+        assert os.path.basename(path) == os.path.basename(fixtures[kind])
+        assert filecmp.cmp(path, fixtures[kind], shallow=False)
+
+
+def test_extract_stage_beats_the_legacy_loop_with_the_same_dates():
+    result = main.bench_extract(rounds=3)
+    assert result["legacy"]["pages"] == result["extract_available_date"]["pages"] > 0
+    assert result["speedup"] > 1
+
+    today = main.datetime.date(2025, 6, 1)
+    for name in main.AGENTS:
+        path = main.bench_fixtures(name).get("detail")
+        if not path or not path.endswith('.html'):
+            continue
+        with open(path, 'rb') as f:
+            document = main.text(main.parse_html(f.read(), 'utf-8'))
+        legacy = main.legacy_available_date(document, today.strftime('%d/%m/%Y'))
+        expected = "Unknown" if legacy == "Unknown" else main.datetime.datetime.strptime(legacy, '%d/%m/%Y').date().isoformat()
+        assert main.extract_available_date(document, today) == expected
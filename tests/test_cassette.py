@@ -0,0 +1,23 @@
+import main
+
+
+def test_record_stores_elapsed_and_replays(tmp_path):
+    stub = main.geoapify_stub({"1 test road": {"lat": 52.0, "lon": -1.0, "formatted": "1 Test Road"}}, latency=0.2)
+    path = str(tmp_path / "cassette.sqlite")
+    url = stub.url + "?text=1+Test+Road&apiKey=secret"
+    try:
+        client = main.http_client(cache_dir='', transport="record", cassette_path=path)
+        recorded = client.get(url)
+        client.close()
+    finally:
+        stub.close()
+
+    store = main.cassette(path)
+    (elapsed,) = store.db.execute("SELECT elapsed FROM responses").fetchone()
+    assert elapsed >= 0.2
+    store.close()
+
+    # The stub is gone, so this can only come from the recording
+    client = main.http_client(cache_dir='', transport="replay", cassette_path=path, retries=0)
+    replayed = client.get(url)
+    assert replayed.json() == recorded.json()
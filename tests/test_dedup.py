@@ -0,0 +1,27 @@
+import main
+
+def card(source, title, lat=52.4430, lon=-1.9470):
+    return main.listing({"title": title, "source": source, "url": f"https://{source}/{title}", "price": "£120 pppw", "lat": lat, "lon": lon})
+
+def test_studios_in_one_building_stay_separate():
+    properties = [
+        card("Direct Housing", "Studio 11, 189 Harborne Lane, Selly Oak, Birmingham"),
+        card("House Hunt", "Studio 12, 189 Harborne Lane"),
+    ]
+    assert main.dedup_key(properties[0]) != main.dedup_key(properties[1])
+    assert len(main.dedup_stage(properties)) == 2
+
+def test_unit_in_title_and_address_in_address():
+    studio = main.listing({"title": "Studio 11", "address": "189 Harborne Lane, Birmingham"})
+    bedsit = main.listing({"title": "Bedsit 11", "address": "189 Harborne Lane, Birmingham"})
+    assert main.dedup_key(studio) == ("189", "harborne lane", ("studio", "11"))
+    assert main.dedup_key(studio) != main.dedup_key(bedsit)
+
+def test_same_studio_from_two_agents_merges():
+    properties = [
+        card("Direct Housing", "Studio 11, 189 Harborne Lane, Selly Oak, Birmingham"),
+        card("House Hunt", "Studio 11, 189 Harborne Lane", lat=52.4431),
+    ]
+    merged = main.dedup_stage(properties)
+    assert len(merged) == 1
+    assert [entry["source"] for entry in merged[0]["sources"]] == ["Direct Housing", "House Hunt"]
@@ -0,0 +1,21 @@
+import json
+
+import main
+
+
+def test_export_normalises_older_snapshots(tmp_path):
+    # A combined.json from before price_pw/beds_count/baths_count were published
+    snapshot = tmp_path / "combined.json"
+    snapshot.write_text(json.dumps([
+        {"title": "115 Tiverton Road", "source": "House Hunt", "price": "£120 pppw", "beds": "3 bedrooms", "baths": "2", "lat": "52.4413", "lon": "-1.9318", "available_date": "01/07/2025", "status": "Available"},
+    ]))
+    output = tmp_path / "data"
+
+    assert main.main(["export", "--input", str(snapshot), "--output", str(output)]) == 0
+
+    columns = json.loads((output / "map.json").read_text())["columns"]
+    assert columns["price_pw"] == [120.0]
+    assert columns["beds"] == [3]
+    assert columns["baths"] == [2]
+    assert columns["lat"] == [52.4413]
+    assert columns["available"] != [None]
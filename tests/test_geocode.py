@@ -0,0 +1,151 @@
+import json
+import time
+import urllib.parse
+
+import pytest
+
+import main
+
+TIVERTON = {"lat": 52.4413, "lon": -1.9318, "formatted": "115 Tiverton Road, Birmingham B29 6BU, United Kingdom"}
+
+
+def query(title):
+    return main.normalise_query(main.geocode_text({"title": title, "source": "House Hunt"}))
+
+
+@pytest.fixture
+def stub(monkeypatch):
+    stub = main.geoapify_stub({
+        query("115 Tiverton Road"): TIVERTON,
+        query("1 Broken Street"): 500,
+    })
+    monkeypatch.setattr(main, "GEOAPIFY_URL", stub.url)
+    yield stub
+    stub.close()
+
+
+@pytest.fixture
+def places(tmp_path):
+    # An empty gazetteer, so every lookup has to go to the stub
+    return main.gazetteer(str(tmp_path / "missing.csv"))
+
+
+def properties(*titles):
+    return [{"title": title, "source": "House Hunt"} for title in titles]
+
+
+def test_geocode_stage_uses_stub_once_per_query(stub, places):
+    cache = main.geocode_cache(':memory:')
+    found = properties(*["115 Tiverton Road"] * 3)
+    missing = properties("2 Nowhere Street")
+
+    main.geocode_stage(found + missing, main.http_client(cache_dir='', transport='live'), cache, places=places)
+
+    for property in found:
+        assert (property['lat'], property['lon']) == (TIVERTON['lat'], TIVERTON['lon'])
+    assert 'lat' not in missing[0]
+    assert stub.requests == 2
+    assert cache.get(query("115 Tiverton Road")) == (True, TIVERTON)
+    assert cache.get(query("2 Nowhere Street")) == (True, None)
+
+    # Cached answers, found or not, are not asked for again
+    main.geocode_stage(properties("115 Tiverton Road", "2 Nowhere Street"), main.http_client(cache_dir='', transport='live'), cache, places=places)
+    assert stub.requests == 2
+
+
+def test_geocode_stage_fills_unknown_coordinates(stub, places):
+    # direct_housing writes "Unknown" when its detail page has no map
+    unknown = [{"title": "115 Tiverton Road", "source": "House Hunt", "lat": "Unknown", "lon": "Unknown"}]
+    located = [{"title": "2 Nowhere Street", "source": "House Hunt", "lat": 52.4, "lon": -1.9}]
+
+    main.geocode_stage(unknown + located, main.http_client(cache_dir='', transport='live'), main.geocode_cache(':memory:'), places=places)
+
+    assert (unknown[0]['lat'], unknown[0]['lon']) == (TIVERTON['lat'], TIVERTON['lon'])
+    assert (located[0]['lat'], located[0]['lon']) == (52.4, -1.9)
+    assert stub.requests == 1
+
+
+def test_geocode_stage_is_rate_limited(stub, places):
+    client = main.http_client(cache_dir='', transport='live')
+    titles = [f"{number} Nowhere Street" for number in range(1, 10)]
+
+    start = time.monotonic()
+    main.geocode_stage(properties(*titles), client, main.geocode_cache(':memory:'), workers=8, places=places)
+    elapsed = time.monotonic() - start
+
+    host = urllib.parse.urlsplit(stub.url).netloc
+    limiter = client.limiters[host]
+    assert limiter.max_rate == main.GEOCODE_RATE
+    assert stub.requests == len(titles)
+    # The first burst goes straight out, the rest wait for tokens at GEOCODE_RATE
+    assert elapsed >= (len(titles) - limiter.burst) / main.GEOCODE_RATE * 0.9
+
+
+def test_geocode_stage_survives_error_responses(stub, places):
+    cache = main.geocode_cache(':memory:')
+    broken = properties("1 Broken Street")
+
+    main.geocode_stage(broken, main.http_client(cache_dir='', transport='live', retries=1, backoff=0), cache, places=places)
+
+    assert 'lat' not in broken[0]
+    # A 500 is retried, then left out of the cache so the next run asks again
+    assert stub.requests == 2
+    assert cache.get(query("1 Broken Street")) == (False, None)
+
+
+def test_build_gazetteer_from_cli(tmp_path):
+    combined = tmp_path / "combined.json"
+    combined.write_text(json.dumps([
+        {"title": "115 Tiverton Road", "source": "House Hunt", "lat": TIVERTON['lat'], "lon": TIVERTON['lon']},
+        {"title": "9 Nowhere Street", "source": "House Hunt"},
+    ]))
+    path = tmp_path / "gazetteer.csv"
+
+    assert main.main(["geocode", "--build-gazetteer", "--input", str(combined), "--gazetteer", str(path)]) == 0
+
+    result = main.gazetteer(str(path)).lookup(main.geocode_text({"title": "115 Tiverton Road", "source": "House Hunt"}))
+    assert (result['lat'], result['lon']) == (TIVERTON['lat'], TIVERTON['lon'])
+    assert main.main(["geocode", "--build-gazetteer", "--input", str(tmp_path / "missing.json"), "--gazetteer", str(path)]) == 1
+
+
+def write_gazetteer(path, rows):
+    path.write_text("kind,key,lat,lon,radius,count\n" + "".join(f"{row}\n" for row in rows))
+    return main.gazetteer(str(path))
+
+
+def test_gazetteer_only_trusts_corroborated_entries(tmp_path):
+    places = write_gazetteer(tmp_path / "gazetteer.csv", [
+        "postcode,b29 6ag,52.445594,-1.934714,0,1",
+        "postcode,b29 7bl,52.447000,-1.938000,40,3",
+        "street,church road,52.463623,-1.922100,0,1",
+        "street,dale road,52.445500,-1.934800,90,4",
+        "street,george road,52.445209,-1.935727,0,1",
+        "address,bristol road|572,52.456046,-1.917621,1637,6",
+        "address,george road|30,52.445209,-1.935727,0,1",
+    ])
+
+    # One sample says nothing about where the rest of a street or postcode is
+    assert places.lookup("200 Church Road") is None
+    assert places.lookup("Flat 2, B29 6AG") is None
+    assert places.lookup("Renwick Apartments, Selly Oak, B29 7BL - Flat 303")["precision"] == "postcode"
+    assert places.lookup("12 Dale Road")["precision"] == "street"
+    # Samples of one house that disagree by a mile are not an address
+    assert places.lookup("572 Bristol Road") is None
+    assert places.lookup("30 George Road")["precision"] == "address"
+    # Georges Road is another street, not a misspelling of George Road
+    assert places.lookup("30 Georges Road") is None
+    assert places.match_street("goerge road") == "george road"
+
+
+def test_build_gazetteer_skips_gazetteer_coordinates(tmp_path):
+    path = tmp_path / "gazetteer.csv"
+    main.build_gazetteer([
+        {"title": "1 Dale Road", "address": "1 Dale Road, Birmingham B29 6AG, United Kingdom", "lat": 52.4455, "lon": -1.9348},
+        {"title": "3 Dale Road", "address": "3 Dale Road, Birmingham B29 6AG, United Kingdom", "lat": 52.4456, "lon": -1.9349},
+        {"title": "5 Dale Road", "lat": 52.4456, "lon": -1.9349, "geocode_precision": "interpolated"},
+    ], str(path))
+
+    places = main.gazetteer(str(path))
+    assert "dale road|5" not in places.index["address"]
+    assert places.index["street"]["dale road"][3] == 2
+    assert places.lookup("Flat 1, B29 6AG")["precision"] == "postcode"
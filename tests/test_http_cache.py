@@ -0,0 +1,48 @@
+import os
+
+import main
+
+
+def response(body):
+    from requests import Response
+    resp = Response()
+    resp.status_code = 200
+    resp._content = body
+    resp.encoding = 'utf-8'
+    resp.headers['Content-Type'] = 'text/html'
+    return resp
+
+
+def test_fields_read_only_the_sidecar(tmp_path, monkeypatch):
+    cache = main.http_cache(str(tmp_path))
+    url = "https://example.invalid/property/1"
+    cache.store(url, response(b"<html>detail</html>"))
+
+    decompressed = []
+    decompress = main.gzip.decompress
+    monkeypatch.setattr(main.gzip, "decompress", lambda data: decompressed.append(data) or decompress(data))
+
+    cache.store_fields(url, "house_hunt:3", {"beds": "3"})
+    assert cache.fields(url, "house_hunt:3") == {"beds": "3"}
+    assert decompressed == []
+
+    # The body is untouched by the sidecar updates
+    assert cache.load(url)['body'] == b"<html>detail</html>"
+
+
+def test_prune_skips_entries_that_vanish(tmp_path, monkeypatch):
+    cache = main.http_cache(str(tmp_path), max_age=0)
+    for number in range(3):
+        cache.store(f"https://example.invalid/property/{number}", response(b"x" * 100))
+    vanished = cache.key("https://example.invalid/property/1") + '.json'
+
+    getmtime = os.path.getmtime
+    def flaky(path):
+        if path == vanished:
+            raise FileNotFoundError(path)
+        return getmtime(path) - 10
+    monkeypatch.setattr(main.os.path, "getmtime", flaky)
+
+    cache.prune()
+
+    assert sorted(os.listdir(tmp_path)) == sorted(os.path.basename(vanished[:-5]) + suffix for suffix in ('.json', '.body'))
@@ -0,0 +1,17 @@
+import typing
+
+import main
+
+
+def test_every_slot_is_annotated():
+    assert set(typing.get_type_hints(main.listing)) == set(main.listing.__slots__)
+
+
+def test_normalised_fields_have_their_annotated_types():
+    property = main.normalise_property(main.listing({"title": "1 Test Road", "price": "£120 pppw", "beds": "3 bedrooms", "lat": "52.44", "lon": "-1.93"}))
+
+    assert property['price_pw'] == 120.0
+    assert property['beds_count'] == 3
+    assert property['baths_count'] is None
+    assert (property['lat'], property['lon']) == (52.44, -1.93)
+    assert main.listing.from_json(property.to_json()).to_json() == property.to_json()
@@ -0,0 +1,24 @@
+import main
+
+
+def test_text_log_shows_the_level_once(capsys, monkeypatch):
+    monkeypatch.setattr(main, "LOG_FORMAT", "text")
+    main.log("Could not find baths for 1 Test Road", "ERROR")
+    main.log("Circuit opened", "WARNING")
+
+    lines = capsys.readouterr().out.splitlines()
+    assert lines == [
+        f"[{main.COLOURS['FAIL']}ERROR{main.COLOURS['ENDC']}] Could not find baths for 1 Test Road",
+        f"[{main.COLOURS['WARNING']}WARNING{main.COLOURS['ENDC']}] Circuit opened",
+    ]
+
+
+def test_easy_lettings_cards_log_no_errors(capsys):
+    fixtures = main.bench_fixtures("easy_lettings")
+    agent = main.AGENTS["easy_lettings"](main.fixture_client(fixtures["listing"]))
+
+    cards = agent.get_page_info(agent.BASE_LINK)
+
+    assert cards
+    # Cards never carry coordinates, the detail page does
+    assert "ERROR" not in capsys.readouterr().out
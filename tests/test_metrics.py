@@ -0,0 +1,54 @@
+import os
+
+import pytest
+
+import main
+
+
+@pytest.fixture
+def metrics():
+    main.METRICS.reset()
+    yield main.METRICS
+    main.METRICS.reset()
+
+
+def test_agent_run_metrics(metrics, tmp_path, monkeypatch):
+    name = "house_hunt"
+    paths = {kind: os.path.abspath(path) for kind, path in main.bench_fixtures(name).items()}
+    if "listing" not in paths:
+        pytest.skip("no fixtures")
+    # The agent writes its ndjson under the relative OUTPUT_DIR
+    monkeypatch.chdir(tmp_path)
+
+    client = main.fixture_client(paths["listing"], paths.get("detail"))
+    agent = main.AGENTS[name](client)
+    main.run_agent(agent, "first")
+
+    assert agent.status == "done"
+    assert metrics.value("agent_runs_total", agent=name, status="done") == 1
+    assert metrics.value("agent_runs_total", agent=name, status="failed") == 0
+    assert metrics.value("agent_requests_total", agent=name) == sum(client.requests.values())
+    assert metrics.value("agent_requests_total", agent=name, kind="listing") == client.requests["listing"]
+
+    report = main.run_report()
+    stats = report["agents"][name]
+    assert stats["status"] == "done"
+    assert stats["properties"] == len(agent.properties)
+    assert sum(stats["requests"].values()) == metrics.value("agent_requests_total", agent=name)
+    assert stats["bytes"] == metrics.value("agent_response_bytes_total", agent=name) > 0
+    assert f'sellyhouses_agent_runs_total{{agent="{name}",status="done"}} 1' in metrics.prometheus().splitlines()
+
+
+def test_mixed_status_labels_export(metrics, tmp_path):
+    # A timeout is counted as "error" next to the numeric statuses of the same host
+    metrics.inc("http_requests_total", host="example.com", status="200")
+    metrics.inc("http_requests_total", host="example.com", status="error")
+    metrics.inc("http_requests_total", host="example.com", status=503)
+
+    lines = metrics.prometheus().splitlines()
+    assert 'sellyhouses_http_requests_total{host="example.com",status="200"} 1' in lines
+    assert 'sellyhouses_http_requests_total{host="example.com",status="error"} 1' in lines
+    assert 'sellyhouses_http_requests_total{host="example.com",status="503"} 1' in lines
+
+    main.write_metrics(str(tmp_path / "run.json"), str(tmp_path / "metrics.prom"))
+    assert main.run_report()["http"]["example.com"] == {"200": 1, "error": 1, "503": 1}
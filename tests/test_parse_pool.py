@@ -0,0 +1,41 @@
+import threading
+
+import pytest
+
+import main
+
+
+def detail_fixture():
+    for name in main.AGENTS:
+        paths = main.bench_fixtures(name)
+        if paths.get('detail'):
+            return name, paths
+    pytest.skip("no detail fixtures")
+
+
+def test_pool_parse_from_agent_thread_matches_inline(monkeypatch):
+    monkeypatch.setattr(main, "PARSE_PROCESSES", 1)
+    name, paths = detail_fixture()
+    client = main.fixture_client(paths.get('listing'), paths['detail'])
+    agent = main.AGENTS[name](client)
+    parse = agent.parse_property_info
+    resp = client.get("https://example.invalid/detail", cache=True)
+
+    inline = dict(parse(agent.parse_response(resp), main.listing({"title": "1 Test Road", "url": resp.url})))
+
+    results = []
+    pool = main.parse_pool()
+    try:
+        # Submitted from a non-main thread, as the agents' detail workers do
+        thread = threading.Thread(target=lambda: results.append(agent.parse_detail(resp, main.listing({"title": "1 Test Road", "url": resp.url}), parse)))
+        thread.start()
+        thread.join(60)
+        assert not thread.is_alive()
+        assert pool is not None and main.PARSE_POOL is pool
+        assert pool._mp_context.get_start_method() == "spawn"
+    finally:
+        main.close_parse_pool()
+
+    assert dict(results[0]) == inline
+    # The agent was built in the worker process, never in this one
+    assert name not in main.PARSE_AGENTS
@@ -0,0 +1,34 @@
+import os, subprocess, sys, textwrap, time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# An agent that ignores cancellation and would sleep far past the deadline, next to one that
+# finishes normally. The process must exit once the grace period has passed, not when the
+# stuck agent wakes up.
+SCRIPT = textwrap.dedent("""
+    import sys, time
+    sys.path.insert(0, sys.argv[1])
+    import main
+
+    class stuck(main.agent):
+        DEADLINE = 0.2
+        def find_all(self):
+            time.sleep(30)
+
+    class quick(main.agent):
+        def find_all(self):
+            self.collect([main.listing({"title": "1 Quick Road", "url": "https://example.com/1"})])
+
+    agents = [stuck(object()), quick(object())]
+    main.schedule_agents(agents, workers=2, grace=0.5)
+    print(agents[0].status, agents[1].status, len(agents[1].properties))
+""")
+
+def test_stuck_agent_does_not_delay_exit(tmp_path):
+    start = time.monotonic()
+    result = subprocess.run([sys.executable, "-c", SCRIPT, ROOT], cwd=tmp_path, capture_output=True, text=True, timeout=60)
+    elapsed = time.monotonic() - start
+
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.split()[-3:] == ["running", "done", "1"]
+    assert elapsed < 10, f"process took {elapsed:.1f}s to exit"
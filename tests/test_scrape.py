@@ -0,0 +1,33 @@
+import json
+import os
+
+import main
+
+
+def offline():
+    # Every request fails, as with an empty replay cassette
+    return main.fixture_client(None)
+
+
+def test_failed_agents_fall_back_to_their_last_output(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    os.makedirs(main.OUTPUT_DIR)
+    with open(os.path.join(main.OUTPUT_DIR, "house_hunt.ndjson"), 'w') as f:
+        f.write(json.dumps({"title": "115 Tiverton Road", "source": "House Hunt", "url": "https://example.invalid/1", "lat": 52.4413, "lon": -1.9318}) + "\n")
+
+    assert main.all(offline(), incremental=False, mode="first") is True
+
+    with open(main.COMBINED_PATH) as f:
+        published = json.load(f)
+    assert [property['title'] for property in published] == ["115 Tiverton Road"]
+
+
+def test_nothing_is_published_when_every_agent_fails(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    with open(main.COMBINED_PATH, 'w') as f:
+        json.dump([{"title": "kept"}], f)
+
+    assert main.all(offline(), incremental=False, mode="first") is False
+
+    with open(main.COMBINED_PATH) as f:
+        assert json.load(f) == [{"title": "kept"}]